@@ -0,0 +1,173 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import select, union_all, literal, case, cast, or_, and_, null, String, Float
+from sqlalchemy.orm import Session
+from .models import TrustHistory, Connection, PeerRating
+
+# urutan sumber untuk timestamp yang sama (sama seperti sort lama: history, koneksi, rating)
+SOURCE_HISTORY = 0
+SOURCE_CONNECTION = 1
+SOURCE_RATING = 2
+
+# event_type TrustHistory -> connection_status di log; selain ini "trust_updated"
+HISTORY_STATUS = {
+    "device_rejoined": "device_joined",
+    "device_left": "device_left",
+    "blacklisted": "blacklisted",
+    "dishonest_rating": "dishonest_rating",
+    "flooding_detected": "flooding_detected",
+}
+MALICIOUS_EVENT_TYPES = ("blacklisted", "dishonest_rating", "flooding_detected")
+
+def encode_cursor(timestamp: datetime, source: int, row_id: int) -> str:
+    raw = json.dumps([timestamp.isoformat(), source, row_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        timestamp, source, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(timestamp), int(source), int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+def _history_columns():
+    activity_type = case((TrustHistory.event_type.in_(MALICIOUS_EVENT_TYPES), "malicious"), else_="normal")
+    status = case(HISTORY_STATUS, value=TrustHistory.event_type, else_="trust_updated")
+    return activity_type, status
+
+def _after_cursor(timestamp_col, id_col, source: int, cursor):
+    # keyset: (timestamp desc, source asc, id desc) harus setelah cursor
+    if cursor is None:
+        return None
+    ts, cursor_source, cursor_id = cursor
+    if source < cursor_source:
+        return timestamp_col < ts
+    if source > cursor_source:
+        return timestamp_col <= ts
+    return or_(timestamp_col < ts, and_(timestamp_col == ts, id_col < cursor_id))
+
+def _branch(columns, timestamp_col, id_col, device_col, activity_col, source: int, filters: dict, limit: int):
+    conditions = []
+    if filters.get("device_id"):
+        conditions.append(device_col == filters["device_id"])
+    if filters.get("activity_type"):
+        conditions.append(activity_col == filters["activity_type"])
+    if filters.get("since"):
+        conditions.append(timestamp_col >= filters["since"])
+    if filters.get("until"):
+        conditions.append(timestamp_col < filters["until"])
+    after = _after_cursor(timestamp_col, id_col, source, filters.get("cursor"))
+    if after is not None:
+        conditions.append(after)
+    # setiap sumber dibatasi sendiri (index timestamp), hasilnya digabung di database
+    stmt = select(*columns).where(*conditions).order_by(timestamp_col.desc(), id_col.desc()).limit(limit)
+    return select(stmt.subquery())
+
+def _activity_query(filters: dict, limit: int):
+    th, c, pr = TrustHistory, Connection, PeerRating
+
+    history_activity, history_status = _history_columns()
+    history = _branch([
+        th.timestamp.label("timestamp"),
+        literal(SOURCE_HISTORY).label("source"),
+        th.id.label("row_id"),
+        th.device_id.label("device_id"),
+        history_activity.label("activity_type"),
+        history_status.label("connection_status"),
+        th.notes.label("notes"),
+        cast(null(), String).label("peer_id"),
+        cast(null(), String).label("connection_type"),
+        cast(null(), Float).label("score"),
+    ], th.timestamp, th.id, th.device_id, history_activity, SOURCE_HISTORY, filters, limit)
+
+    connection_activity = case((c.status == True, "normal"), else_="malicious")
+    connection_status = case((c.status == True, "success"), else_="failed")
+    connections = _branch([
+        c.timestamp,
+        literal(SOURCE_CONNECTION),
+        c.id,
+        c.source_device_id,
+        connection_activity,
+        connection_status,
+        cast(null(), String),
+        c.target_device_id,
+        c.connection_type,
+        cast(null(), Float),
+    ], c.timestamp, c.id, c.source_device_id, connection_activity, SOURCE_CONNECTION, filters, limit)
+
+    rating_activity = literal("normal")
+    ratings = _branch([
+        pr.timestamp,
+        literal(SOURCE_RATING),
+        pr.id,
+        pr.rater_device_id,
+        rating_activity,
+        literal("peer_rating"),
+        cast(null(), String),
+        pr.rated_device_id,
+        cast(null(), String),
+        pr.score,
+    ], pr.timestamp, pr.id, pr.rater_device_id, rating_activity, SOURCE_RATING, filters, limit)
+
+    merged = union_all(history, connections, ratings).subquery()
+    return select(merged).order_by(
+        merged.c.timestamp.desc(), merged.c.source, merged.c.row_id.desc()
+    ).limit(limit)
+
+def _log_entry(row) -> dict:
+    if row.source == SOURCE_HISTORY:
+        description = row.notes
+        status = row.connection_status
+    elif row.source == SOURCE_CONNECTION:
+        description = f"Connection to {row.peer_id} ({row.connection_type})"
+        status = row.connection_status
+        if row.connection_type != "data":
+            status += f"_{row.connection_type}"
+    else:
+        description = f"Rated {row.peer_id} with score {row.score}"
+        status = row.connection_status
+    return {
+        "timestamp": row.timestamp,
+        "device_id": row.device_id,
+        "activity_type": row.activity_type,
+        "description": description,
+        "connection_status": status,
+    }
+
+def get_activity_page(session: Session, limit: int = 100, cursor: str = None, device_id: str = None,
+                      activity_type: str = None, since: datetime = None, until: datetime = None):
+    """
+    Satu halaman log aktivitas (TrustHistory, Connection, PeerRating) terbaru lebih dulu.
+    Mengembalikan (logs, next_cursor); next_cursor None jika tidak ada halaman berikutnya.
+    """
+    filters = {
+        "device_id": device_id,
+        "activity_type": activity_type,
+        "since": since,
+        "until": until,
+        "cursor": decode_cursor(cursor) if cursor else None,
+    }
+    rows = session.execute(_activity_query(filters, limit + 1)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.timestamp, last.source, last.row_id)
+    return [_log_entry(row) for row in rows], next_cursor
+
+def iter_activity(session: Session, page_size: int = 500, limit: int = None, **filters):
+    # semua log yang cocok, dimuat per halaman sehingga memori tetap kecil
+    cursor = filters.pop("cursor", None)
+    remaining = limit
+    while True:
+        size = page_size if remaining is None else min(page_size, remaining)
+        logs, cursor = get_activity_page(session, limit=size, cursor=cursor, **filters)
+        yield from logs
+        if remaining is not None:
+            remaining -= len(logs)
+            if remaining <= 0:
+                return
+        if cursor is None:
+            return
@@ -0,0 +1,259 @@
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from sqlalchemy import event, select, func
+from sqlalchemy.orm import Session
+from .models import Device, SystemState, SuspiciousEvent
+
+# cache state device per proses untuk lookup reputasi; entri dihapus setelah commit yang
+# mengubah device, TTL membatasi data basi dari worker lain
+DEVICE_CACHE_TTL_SECONDS = float(os.getenv("DEVICE_CACHE_TTL_SECONDS", "5"))
+DEVICE_CACHE_MAX_ENTRIES = int(os.getenv("DEVICE_CACHE_MAX_ENTRIES", "50000"))
+# seberapa sering worker memeriksa epoch koordinator di database (perubahan dari worker lain)
+COORDINATOR_EPOCH_POLL_SECONDS = float(os.getenv("COORDINATOR_EPOCH_POLL_SECONDS", "1"))
+COORDINATOR_EPOCH_KEY = "coordinator_epoch"
+# jumlah tipe suspicious event terakhir yang disimpan per device (recent_suspicious_types)
+RECENT_SUSPICIOUS_TYPES = 3
+
+# kolom Device yang dipakai get_reputation_level dan get_device_reputation_info
+DeviceState = namedtuple("DeviceState", [
+    "id", "trust_score", "is_blacklisted", "is_flagged", "suspicious_count",
+    "last_suspicious_activity", "suspicious_types"
+])
+
+def device_state(device: Device, suspicious_types=()) -> DeviceState:
+    return DeviceState(
+        id=device.id,
+        trust_score=device.trust_score,
+        is_blacklisted=device.is_blacklisted,
+        is_flagged=device.is_flagged,
+        suspicious_count=device.suspicious_count,
+        last_suspicious_activity=device.last_suspicious_activity,
+        suspicious_types=tuple(suspicious_types)
+    )
+
+def recent_suspicious_types(session: Session, device_ids, limit: int = RECENT_SUSPICIOUS_TYPES) -> dict:
+    # {device_id: (tipe, ...)} terlama -> terbaru, `limit` event terakhir per device dalam satu query
+    if not device_ids:
+        return {}
+    ranked = select(
+        SuspiciousEvent.device_id,
+        SuspiciousEvent.event_type,
+        SuspiciousEvent.timestamp,
+        SuspiciousEvent.id,
+        func.row_number().over(
+            partition_by=SuspiciousEvent.device_id,
+            order_by=(SuspiciousEvent.timestamp.desc(), SuspiciousEvent.id.desc())
+        ).label("rank")
+    ).where(SuspiciousEvent.device_id.in_(device_ids)).subquery()
+    rows = session.execute(
+        select(ranked.c.device_id, ranked.c.event_type)
+        .where(ranked.c.rank <= limit)
+        .order_by(ranked.c.device_id, ranked.c.timestamp, ranked.c.id)
+    )
+    types = {}
+    for device_id, event_type in rows:
+        types.setdefault(device_id, []).append(event_type)
+    return types
+
+class DeviceCache:
+    def __init__(self, ttl_seconds: float = DEVICE_CACHE_TTL_SECONDS, max_entries: int = DEVICE_CACHE_MAX_ENTRIES, clock=time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # dinaikkan setiap invalidasi; hasil load yang dimulai sebelum invalidasi tidak disimpan
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def _lookup(self, device_id: str):
+        entry = self._entries.get(device_id)
+        if entry is None:
+            return None
+        state, expires_at = entry
+        if expires_at <= self.clock():
+            del self._entries[device_id]
+            return None
+        self._entries.move_to_end(device_id)
+        return state
+
+    def _store(self, states, generation: int):
+        if generation != self._generation:
+            return
+        expires_at = self.clock() + self.ttl_seconds
+        for state in states:
+            self._entries[state.id] = (state, expires_at)
+            self._entries.move_to_end(state.id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_many(self, session: Session, device_ids) -> dict:
+        # {device_id: DeviceState}; semua miss dimuat dengan satu query IN
+        found, missing = {}, []
+        with self._lock:
+            for device_id in dict.fromkeys(device_ids):
+                state = self._lookup(device_id)
+                if state is None:
+                    missing.append(device_id)
+                else:
+                    found[device_id] = state
+            self.hits += len(found)
+            self.misses += len(missing)
+            generation = self._generation
+
+        if missing:
+            devices = session.query(Device).filter(Device.id.in_(missing)).all()
+            # tipe event hanya dimuat untuk device yang pernah mencurigakan
+            types = recent_suspicious_types(session, [d.id for d in devices if d.suspicious_count])
+            loaded = [device_state(d, types.get(d.id, ())) for d in devices]
+            with self._lock:
+                self._store(loaded, generation)
+            found.update((state.id, state) for state in loaded)
+        return found
+
+    def get(self, session: Session, device_id: str):
+        return self.get_many(session, [device_id]).get(device_id)
+
+    def invalidate(self, device_ids=None):
+        # None -> semua entri (mis. setelah bulk update)
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if device_ids is None:
+                self._entries.clear()
+            else:
+                for device_id in device_ids:
+                    self._entries.pop(device_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions
+            }
+
+class CoordinatorSlot:
+    # id koordinator saat ini beserta epoch-nya; hanya select_coordinator yang mengubah koordinator
+    # dan menaikkan epoch di system_state, worker lain memuat ulang jika epoch berbeda
+    def __init__(self, poll_seconds: float = COORDINATOR_EPOCH_POLL_SECONDS, clock=time.monotonic):
+        self.poll_seconds = poll_seconds
+        self.clock = clock
+        self.coordinator_id = None
+        self.epoch = None
+        self.checked_at = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.reloads = 0
+
+    def get(self, session: Session):
+        # pemilihan yang belum di-commit di session ini lebih dulu dipakai
+        pending = session.info.get("pending_coordinator")
+        if pending is not None:
+            return pending[0]
+
+        with self._lock:
+            if self.epoch is not None and self.clock() - self.checked_at < self.poll_seconds:
+                self.hits += 1
+                return self.coordinator_id
+
+        epoch = read_coordinator_epoch(session)
+        with self._lock:
+            if self.epoch == epoch:
+                self.checked_at = self.clock()
+                self.hits += 1
+                return self.coordinator_id
+
+        coordinator_id = session.execute(
+            select(Device.id).where(Device.is_coordinator == True).limit(1)
+        ).scalar()
+        self.publish(coordinator_id, epoch)
+        with self._lock:
+            self.reloads += 1
+        return coordinator_id
+
+    def publish(self, coordinator_id, epoch: int):
+        with self._lock:
+            if self.epoch is not None and epoch < self.epoch:
+                return
+            self.coordinator_id = coordinator_id
+            self.epoch = epoch
+            self.checked_at = self.clock()
+
+    def invalidate(self):
+        with self._lock:
+            self.epoch = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "coordinator_id": self.coordinator_id,
+                "epoch": self.epoch,
+                "poll_seconds": self.poll_seconds,
+                "hits": self.hits,
+                "reloads": self.reloads
+            }
+
+def read_coordinator_epoch(session: Session) -> int:
+    return session.execute(
+        select(SystemState.value).where(SystemState.key == COORDINATOR_EPOCH_KEY)
+    ).scalar() or 0
+
+device_cache = DeviceCache()
+coordinator_slot = CoordinatorSlot()
+
+# --- invalidasi otomatis dari session ---
+# id device yang berubah dikumpulkan saat flush dan dihapus dari cache setelah commit/rollback,
+# sehingga record_connection, add_peer_rating, blacklist_device dsb. tidak perlu memanggilnya sendiri
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_devices(session, flush_context):
+    changed = session.info.setdefault("changed_devices", set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Device):
+            changed.add(obj.id)
+
+@event.listens_for(Session, "after_bulk_update")
+def _collect_bulk_update(update_context):
+    if update_context.mapper.class_ is Device:
+        update_context.session.info["changed_devices_all"] = True
+
+def _invalidate_changed(session):
+    changed = session.info.pop("changed_devices", None)
+    if session.info.pop("changed_devices_all", False):
+        device_cache.invalidate()
+    elif changed:
+        device_cache.invalidate(changed)
+
+# savepoint (write queue) juga memicu after_commit/after_rollback; perubahan dan pemilihan
+# koordinator baru diterapkan setelah transaksi luar selesai
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    if session.in_nested_transaction():
+        return
+    _invalidate_changed(session)
+    # hasil pemilihan koordinator dipublikasikan ke slot setelah tersimpan
+    pending = session.info.pop("pending_coordinator", None)
+    if pending is not None:
+        coordinator_slot.publish(*pending)
+
+@event.listens_for(Session, "after_rollback")
+def _invalidate_after_rollback(session):
+    if session.in_nested_transaction():
+        return
+    # entri yang dimuat dari perubahan yang belum di-commit ikut dihapus
+    _invalidate_changed(session)
+    session.info.pop("pending_coordinator", None)
@@ -0,0 +1,158 @@
+import heapq
+import os
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from .models import Device
+
+# ranking kandidat dibangun ulang dari database setelah umur ini, untuk menangkap
+# perubahan trust dari worker lain
+ELECTION_RANKING_TTL_SECONDS = float(os.getenv("ELECTION_RANKING_TTL_SECONDS", "60"))
+
+# hanya internal devices - RSU internal > Computer internal berdasarkan trust
+COORDINATOR_DEVICE_TYPES = ("RSU", "Computer")
+
+class CandidateRanking:
+    # heap (RSU dulu, trust tertinggi, device terlama) dengan lazy deletion: entri lama tetap di heap
+    # dan dibuang saat sampai di puncak jika tidak sama dengan key terbaru di self._keys
+    def __init__(self, min_trust: float, ttl_seconds: float = ELECTION_RANKING_TTL_SECONDS, clock=time.monotonic):
+        self.min_trust = min_trust
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._heap = []
+        self._keys = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self.rebuilds = 0
+        self.stale_pops = 0
+
+    def _key(self, device_type, trust_score, created_at, device_id) -> tuple:
+        return (0 if device_type == "RSU" else 1, -trust_score, created_at or datetime.max, device_id)
+
+    def candidate_key(self, device: Device):
+        # None jika device tidak bisa menjadi koordinator
+        if (
+            device.is_blacklisted
+            or device.ownership_type != "internal"
+            or device.device_type not in COORDINATOR_DEVICE_TYPES
+            or device.trust_score is None
+            or device.trust_score < self.min_trust
+            or not device.is_active
+        ):
+            return None
+        return self._key(device.device_type, device.trust_score, device.created_at, device.id)
+
+    def update(self, device_id: str, key):
+        with self._lock:
+            if self._loaded_at is None or self._keys.get(device_id) == key:
+                return
+            if key is None:
+                self._keys.pop(device_id, None)
+            else:
+                self._keys[device_id] = key
+                heapq.heappush(self._heap, key)
+            # heap dipadatkan jika entri basi mendominasi
+            if len(self._heap) > 4 * len(self._keys) + 64:
+                self._heap = list(self._keys.values())
+                heapq.heapify(self._heap)
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def _rebuild(self, session: Session):
+        rows = session.execute(
+            select(Device.id, Device.device_type, Device.trust_score, Device.created_at).where(
+                Device.is_blacklisted == False,
+                Device.ownership_type == "internal",
+                Device.device_type.in_(COORDINATOR_DEVICE_TYPES),
+                Device.trust_score >= self.min_trust,
+                Device.is_active == True
+            )
+        ).all()
+        keys = {row.id: self._key(row.device_type, row.trust_score, row.created_at, row.id) for row in rows}
+        heap = list(keys.values())
+        heapq.heapify(heap)
+        with self._lock:
+            self._keys = keys
+            self._heap = heap
+            self._loaded_at = self.clock()
+            self.rebuilds += 1
+
+    def _peek(self):
+        # kandidat teratas menurut ranking, entri basi dibuang
+        with self._lock:
+            while self._heap:
+                key = self._heap[0]
+                if self._keys.get(key[-1]) == key:
+                    return key
+                heapq.heappop(self._heap)
+                self.stale_pops += 1
+        return None
+
+    def best(self, session: Session, load_device):
+        """
+        Kandidat koordinator terbaik, divalidasi ulang terhadap database lewat
+        load_device(session, device_id) (mis. dengan row lock). Kandidat yang
+        ternyata sudah berubah diperbarui di ranking lalu pencarian dilanjutkan.
+        """
+        if self._loaded_at is None or self.clock() - self._loaded_at >= self.ttl_seconds:
+            self._rebuild(session)
+
+        while True:
+            key = self._peek()
+            if key is None:
+                return None
+            device = load_device(session, key[-1])
+            actual = self.candidate_key(device) if device is not None else None
+            if actual == key:
+                return device
+            self.update(key[-1], actual)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "candidates": len(self._keys),
+                "heap_size": len(self._heap),
+                "loaded": self._loaded_at is not None,
+                "rebuilds": self.rebuilds,
+                "stale_pops": self.stale_pops
+            }
+
+def track_candidates(ranking: CandidateRanking):
+    # ranking diperbarui dari setiap flush yang mengubah device; jika transaksi dibatalkan,
+    # ranking dibangun ulang pada pemilihan berikutnya
+    @event.listens_for(Session, "after_flush")
+    def _update_ranking(session, flush_context):
+        for obj in (*session.new, *session.dirty):
+            if isinstance(obj, Device):
+                ranking.update(obj.id, ranking.candidate_key(obj))
+                session.info["ranking_touched"] = True
+        for obj in session.deleted:
+            if isinstance(obj, Device):
+                ranking.update(obj.id, None)
+                session.info["ranking_touched"] = True
+
+    @event.listens_for(Session, "after_bulk_update")
+    def _bulk_update(update_context):
+        if update_context.mapper.class_ is Device:
+            ranking.invalidate()
+
+    # after_commit dan after_soft_rollback juga dipanggil untuk savepoint (write queue);
+    # flag disimpan sampai transaksi luar selesai
+    @event.listens_for(Session, "after_commit")
+    def _committed(session):
+        if session.in_nested_transaction():
+            return
+        session.info.pop("ranking_touched", None)
+
+    @event.listens_for(Session, "after_soft_rollback")
+    def _rolled_back(session, previous_transaction):
+        if previous_transaction.nested:
+            touched = session.info.get("ranking_touched", False)
+        else:
+            touched = session.info.pop("ranking_touched", False)
+        if touched:
+            ranking.invalidate()
@@ -0,0 +1,175 @@
+import asyncio
+import json
+import os
+import threading
+from collections import deque
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from .models import Device
+
+# event terakhir yang disimpan untuk resume (Last-Event-ID) setelah reconnect
+EVENT_BUFFER_SIZE = int(os.getenv("EVENT_BUFFER_SIZE", "1000"))
+# antrean per client; client yang tertinggal lebih jauh menerima event "reset"
+EVENT_SUBSCRIBER_QUEUE_SIZE = int(os.getenv("EVENT_SUBSCRIBER_QUEUE_SIZE", "1000"))
+EVENT_KEEPALIVE_SECONDS = float(os.getenv("EVENT_KEEPALIVE_SECONDS", "15"))
+
+class Subscription:
+    # penerima event untuk satu koneksi /events, dibaca dari event loop yang membuatnya
+    def __init__(self, loop, max_queue: int):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.overflowed = False
+
+    def _put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    def push(self, item):
+        # bisa dipanggil dari thread mana pun (threadpool request, thread penulis)
+        self.loop.call_soon_threadsafe(self._put, item)
+
+class EventBus:
+    """
+    Event perubahan trust per proses. Setiap event mendapat nomor urut (seq) yang naik
+    terus; event terakhir disimpan di ring buffer agar client bisa melanjutkan dari seq
+    terakhir yang diterimanya.
+    """
+    def __init__(self, buffer_size: int = EVENT_BUFFER_SIZE, queue_size: int = EVENT_SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._buffer = deque(maxlen=buffer_size)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self.seq = 0
+        self.published = 0
+
+    def publish(self, events):
+        # events: [(tipe, data), ...] -> [(seq, tipe, data), ...]
+        if not events:
+            return []
+        with self._lock:
+            numbered = []
+            for event_type, data in events:
+                self.seq += 1
+                numbered.append((self.seq, event_type, data))
+            self._buffer.extend(numbered)
+            self.published += len(numbered)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            for item in numbered:
+                subscription.push(item)
+        return numbered
+
+    def subscribe(self, last_event_id: int = None):
+        """
+        Mendaftarkan client baru. Mengembalikan (subscription, backlog): backlog berisi event
+        setelah last_event_id dari buffer, atau satu event "reset" jika event tersebut sudah
+        tidak ada di buffer (client perlu memuat ulang datanya).
+        """
+        subscription = Subscription(asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+            if last_event_id is None or last_event_id == self.seq:
+                backlog = []
+            elif last_event_id > self.seq or (self._buffer and last_event_id < self._buffer[0][0] - 1):
+                backlog = [(self.seq, "reset", {})]
+            else:
+                backlog = [item for item in self._buffer if item[0] > last_event_id]
+        return subscription, backlog
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "seq": self.seq,
+                "published": self.published,
+                "buffered": len(self._buffer),
+                "subscribers": len(self._subscribers)
+            }
+
+event_bus = EventBus()
+
+def format_sse(seq: int, event_type: str, data: dict) -> str:
+    return f"id: {seq}\nevent: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def stream_events(request, last_event_id: int = None, bus: EventBus = event_bus):
+    # generator untuk StreamingResponse /events; komentar keep-alive saat idle
+    subscription, backlog = bus.subscribe(last_event_id)
+    try:
+        for item in backlog:
+            yield format_sse(*item)
+        while True:
+            try:
+                item = await asyncio.wait_for(subscription.queue.get(), timeout=EVENT_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            if subscription.overflowed:
+                # event terlewat karena client terlalu lambat
+                subscription.overflowed = False
+                while not subscription.queue.empty():
+                    item = subscription.queue.get_nowait()
+                yield format_sse(item[0], "reset", {})
+                continue
+            yield format_sse(*item)
+    finally:
+        bus.unsubscribe(subscription)
+
+# --- event dari session ---
+# event dikumpulkan saat flush dan dipublikasikan setelah commit; rollback membuangnya
+
+def stage_event(session: Session, event_type: str, data: dict):
+    session.info.setdefault("pending_events", []).append((event_type, data))
+
+def _device_events(device: Device, is_new: bool) -> list:
+    if is_new:
+        return [("device_joined", {"device_id": device.id, "device_type": device.device_type, "trust_score": device.trust_score})]
+
+    state = inspect(device)
+
+    def changed(attr):
+        return state.attrs[attr].history.has_changes()
+
+    events = []
+    if changed("trust_score"):
+        events.append(("trust_updated", {"device_id": device.id, "trust_score": device.trust_score}))
+    if changed("is_blacklisted") and device.is_blacklisted:
+        events.append(("blacklisted", {"device_id": device.id, "trust_score": device.trust_score}))
+    elif changed("is_active"):
+        event_type = "device_joined" if device.is_active else "device_left"
+        events.append((event_type, {"device_id": device.id, "device_type": device.device_type, "trust_score": device.trust_score}))
+    if changed("is_flagged") and device.is_flagged:
+        events.append(("flagged", {"device_id": device.id, "suspicious_count": device.suspicious_count}))
+    return events
+
+@event.listens_for(Session, "after_flush")
+def _collect_device_events(session, flush_context):
+    for obj in session.new:
+        if isinstance(obj, Device):
+            for event_type, data in _device_events(obj, True):
+                stage_event(session, event_type, data)
+    for obj in session.dirty:
+        if isinstance(obj, Device):
+            for event_type, data in _device_events(obj, False):
+                stage_event(session, event_type, data)
+
+# savepoint (write queue) juga memicu after_commit/after_rollback; event job yang gagal
+# dibuang oleh write queue, sisanya menunggu transaksi luar
+
+@event.listens_for(Session, "after_commit")
+def _publish_after_commit(session):
+    if session.in_nested_transaction():
+        return
+    event_bus.publish(session.info.pop("pending_events", None))
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop("pending_events", None)
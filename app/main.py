@@ -1,16 +1,35 @@
 # uvicorn app.main:app --reload --port 8000
 
-from fastapi import FastAPI, HTTPException, Depends
-from sqlalchemy.orm import Session, joinedload
-from .database import SessionLocal, engine
-from . import models, services
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import SessionLocal, ReadSessionLocal, engine, get_async_sessionmaker
+from . import models, services, migrations, activity_log, events, rollups
+from .trust_engine import get_trust_engine, get_async_trust_engine, run_with_engine, TrustEngineUnavailable
+from .write_queue import WRITE_QUEUE_ENABLED, execute_write, get_single_writer
+from .cache import device_cache, coordinator_slot
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Literal, Optional, Union
 from fastapi.middleware.cors import CORSMiddleware
-from datetime import datetime
+from datetime import datetime, timedelta
+import asyncio
+import hashlib
+import json
 import logging
+import os
 
-models.Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
+
+migrations.upgrade(engine)
+
+# jumlah item maksimum per request pada /connect/batch dan /rate_peer/batch
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "500"))
+# ukuran halaman maksimum /log_activity
+MAX_LOG_PAGE_SIZE = int(os.getenv("MAX_LOG_PAGE_SIZE", "1000"))
+# ukuran halaman (dan default) /devices/
+MAX_DEVICE_PAGE_SIZE = int(os.getenv("MAX_DEVICE_PAGE_SIZE", "1000"))
 
 app = FastAPI()
 
@@ -20,15 +39,33 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
-def get_db():
-    db = SessionLocal()
+READ_ONLY_METHODS = ("GET", "HEAD")
+
+def get_db(request: Request):
+    db = (ReadSessionLocal if request.method in READ_ONLY_METHODS else SessionLocal)()
     try:
         yield db
     finally:
         db.close()
 
+async def get_async_db(request: Request):
+    async with get_async_sessionmaker(read_only=request.method in READ_ONLY_METHODS)() as session:
+        yield session
+
+def run_async_path(session: Session, fn, *args, **kwargs):
+    # dijalankan lewat AsyncSession.run_sync: query ke SQLite dan request ke trust-service
+    # di-await di event loop, bukan memblok worker threadpool
+    return run_with_engine(get_async_trust_engine(), fn, session, *args, **kwargs)
+
+async def run_async_write(db: AsyncSession, fn, *args, **kwargs):
+    # dengan write queue, event loop hanya menunggu future dari thread penulis
+    if WRITE_QUEUE_ENABLED:
+        return await asyncio.wrap_future(get_single_writer().submit(fn, *args, **kwargs))
+    return await db.run_sync(run_async_path, fn, *args, **kwargs)
+
 # schemas
 class DeviceCreate(BaseModel):
     id: str
@@ -65,6 +102,14 @@ class TrustRecord(BaseModel):
     class Config:
         orm_mode = True
 
+class TrustRollupRecord(BaseModel):
+    timestamp: datetime  # awal bucket
+    trust_score: float  # trust terakhir di bucket
+    min_trust: float
+    max_trust: float
+    last_timestamp: datetime
+    count: int
+
 class ReputationInfo(BaseModel):
     exists: bool
     trust_score: Optional[float] = None
@@ -75,11 +120,70 @@ class ReputationInfo(BaseModel):
     last_suspicious_activity: Optional[datetime] = None
     recent_suspicious_types: Optional[List[str]] = None
 
+class SuspiciousEventRecord(BaseModel):
+    id: int
+    device_id: str
+    event_type: str
+    timestamp: datetime
+    details: Optional[str] = None
+
+    class Config:
+        orm_mode = True
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # perbandingan weak: W/"x" sama dengan "x", daftar dipisah koma atau "*"
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in [t.removeprefix("W/") for t in tags]
+
+def check_batch_size(items: list):
+    if not items:
+        raise HTTPException(status_code=422, detail="Batch is empty")
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch of {len(items)} items exceeds limit of {MAX_BATCH_SIZE}")
+
 # routes
 @app.get("/")
 def root():
     return {"message": "ITS Trust Backend"}
 
+@app.get("/trust_engine/stats")
+def trust_engine_stats():
+    # dipakai untuk menentukan ukuran pool koneksi ke trust-service
+    return get_trust_engine().stats()
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "devices": device_cache.stats(),
+        "coordinator": coordinator_slot.stats(),
+        "coordinator_candidates": services.coordinator_ranking.stats()
+    }
+
+@app.get("/events")
+async def stream_events(request: Request, last_event_id: Optional[int] = None):
+    # SSE; EventSource mengirim Last-Event-ID saat reconnect, query last_event_id untuk client lain
+    header = request.headers.get("last-event-id")
+    if header:
+        try:
+            last_event_id = int(header)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    return StreamingResponse(
+        events.stream_events(request, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/events/stats")
+def event_stats():
+    return events.event_bus.stats()
+
+@app.get("/write_queue/stats")
+def write_queue_stats():
+    return get_single_writer().stats()
+
 @app.post("/device")
 def add_device(device: DeviceCreate, db: Session = Depends(get_db)):
     try:
@@ -87,6 +191,8 @@ def add_device(device: DeviceCreate, db: Session = Depends(get_db)):
         return result
     except ValueError as e:
         raise HTTPException(status_code=403, detail=str(e))
+    except TrustEngineUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
 @app.post("/device/{device_id}/leave")
 def leave_device(device_id: str, db: Session = Depends(get_db)):
@@ -108,16 +214,57 @@ def connect_device(conn: ConnectionCreate, db: Session = Depends(get_db)):
             "connection_type": conn.connection_type
         }
         
-        result = services.record_connection(db, connection_data)
+        result = execute_write(db, services.record_connection, connection_data)
         return result
         
     except Exception as e:
         print(f"Connection error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
     
+@app.post("/connect/batch")
+def connect_devices_batch(conns: List[ConnectionCreate], db: Session = Depends(get_db)):
+    check_batch_size(conns)
+    try:
+        connection_data = [{
+            "source_id": conn.device_id,
+            "target_id": conn.connected_device_id,
+            "status": conn.status,
+            "connection_type": conn.connection_type
+        } for conn in conns]
+        return execute_write(db, services.record_connection, connection_data)
+
+    except Exception as e:
+        logger.error(f"Connection batch error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/devices/")
-def list_devices(db: Session = Depends(get_db)):
-    devices = db.query(models.Device).options(joinedload(models.Device.connections_received)).all()
+def list_devices(
+    request: Request,
+    response: Response,
+    limit: int = Query(MAX_DEVICE_PAGE_SIZE, ge=1, le=MAX_DEVICE_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    # fields=id,trust_score,... -> hanya kolom tersebut; halaman berikutnya lewat header X-Next-Cursor
+    selected = None
+    if fields:
+        selected = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in selected if f not in services.DEVICE_LIST_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=422, detail=f"Unknown device field(s): {', '.join(unknown)}")
+
+    # ETag dari versi tabel devices dan parameter request; poll tanpa perubahan cukup satu query agregat
+    count, last_update = services.devices_version(db)
+    version = f"{count}|{last_update}|{limit}|{cursor}|{','.join(selected or [])}"
+    etag = f'W/"{hashlib.sha1(version.encode()).hexdigest()}"'
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    devices, next_cursor = services.list_devices(db, fields=selected, limit=limit, cursor=cursor)
+    response.headers["ETag"] = etag
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return devices
 
 @app.get("/device/{device_id}")
@@ -127,14 +274,46 @@ def get_device(device_id: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Device not found")
     return device
 
-@app.get("/device/{device_id}/history", response_model=List[TrustRecord])
-def get_trust_history(device_id: str, db: Session = Depends(get_db)):
-    history = db.query(models.TrustHistory).filter_by(device_id=device_id).order_by(models.TrustHistory.timestamp.asc()).all()
-    return history
+@app.get("/device/{device_id}/history", response_model=List[Union[TrustRecord, TrustRollupRecord]])
+def get_trust_history(
+    device_id: str,
+    resolution: Literal["raw", "1s", "1m", "1h"] = "raw",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    # raw -> semua baris trust_history; selain itu satu baris per bucket dari trust_history_rollups
+    if resolution != "raw":
+        return rollups.get_history(db, device_id, resolution, since, until)
+
+    query = db.query(models.TrustHistory).filter_by(device_id=device_id)
+    if since is not None:
+        query = query.filter(models.TrustHistory.timestamp >= since)
+    if until is not None:
+        query = query.filter(models.TrustHistory.timestamp < until)
+    return query.order_by(models.TrustHistory.timestamp.asc()).all()
+
+@app.get("/device/{device_id}/suspicious_events", response_model=List[SuspiciousEventRecord])
+def get_suspicious_events(device_id: str, limit: int = Query(10, ge=1, le=1000), db: Session = Depends(get_db)):
+    return services.get_suspicious_events(db, device_id, limit)
+
+@app.get("/suspicious_events/summary")
+def get_suspicious_event_summary(
+    minutes: int = Query(60, ge=1),
+    bucket_seconds: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_db)
+):
+    # jumlah event per tipe dalam `minutes` terakhir, opsional per window bucket_seconds
+    since = datetime.utcnow() - timedelta(minutes=minutes)
+    return {
+        "since": since,
+        "counts": services.count_suspicious_events(db, since, bucket_seconds=bucket_seconds)
+    }
 
 @app.get("/coordinator")
 def get_current_coordinator(db: Session = Depends(get_db)):
-    coord = db.query(models.Device).filter_by(is_coordinator=True).first()
+    coordinator_id = services.get_coordinator_id(db)
+    coord = db.get(models.Device, coordinator_id) if coordinator_id else None
     if not coord:
         raise HTTPException(status_code=404, detail="No coordinator found")
     return coord
@@ -147,8 +326,9 @@ def get_trust_history_by_coordinator(coordinator_id: str, db: Session = Depends(
 @app.post("/rate_peer/")
 def rate_peer(rating: PeerRatingCreate, db: Session = Depends(get_db)):
     try:
-        services.add_peer_rating(
-            db, 
+        execute_write(
+            db,
+            services.add_peer_rating,
             rating.rater_device_id, 
             rating.rated_device_id, 
             rating.score,
@@ -159,70 +339,55 @@ def rate_peer(rating: PeerRatingCreate, db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/rate_peer/batch")
+def rate_peer_batch(ratings: List[PeerRatingCreate], db: Session = Depends(get_db)):
+    check_batch_size(ratings)
+    try:
+        results = execute_write(db, services.add_peer_ratings, [{
+            "rater_id": rating.rater_device_id,
+            "rated_id": rating.rated_device_id,
+            "score": rating.score,
+            "reason": rating.comment
+        } for rating in ratings])
+        recorded = sum(1 for r in results if r["status"] == "recorded")
+        return {"message": f"{recorded} of {len(ratings)} peer ratings recorded", "results": results}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/log_activity")
-def get_log_activity(db: Session = Depends(get_db)):
-    logs = []
+def get_log_activity(
+    response: Response,
+    limit: int = Query(100, ge=1, le=MAX_LOG_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    device_id: Optional[str] = None,
+    activity_type: Optional[Literal["normal", "malicious"]] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    format: Literal["json", "ndjson"] = "json",
+    db: Session = Depends(get_db)
+):
+    # terbaru lebih dulu; halaman berikutnya lewat header X-Next-Cursor
+    filters = {"device_id": device_id, "activity_type": activity_type, "since": since, "until": until}
+    try:
+        if cursor:
+            activity_log.decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # TrustHistory
-    history_entries = db.query(models.TrustHistory).order_by(models.TrustHistory.timestamp.desc()).all()
-    for h in history_entries:
-        notes_lower = (h.notes or "").lower()
-        
-        malicious_keywords = ["blacklist", "dishonest", "flooding"]
-        is_malicious = any(keyword in notes_lower for keyword in malicious_keywords)
-        activity_type = "malicious" if is_malicious else "normal"
-
-        status_detail = "trust_updated"
-        if "joined" in notes_lower:
-            status_detail = "device_joined"
-        elif "left the system" in notes_lower:
-            status_detail = "device_left"
-        elif "blacklist" in notes_lower:
-            status_detail = "blacklisted"
-        elif "dishonest" in notes_lower:
-            status_detail = "dishonest_rating"
-        elif "flooding" in notes_lower:
-            status_detail = "flooding_detected"
-        elif "unregistered" in notes_lower:
-            status_detail = "denied_unregistered"
-        elif "trust too low" in notes_lower:
-            status_detail = "trust_rejected"
-
-        logs.append({
-            "timestamp": h.timestamp,
-            "device_id": h.device_id,
-            "activity_type": activity_type,
-            "description": h.notes,
-            "connection_status": status_detail,
-        })
-
-    # Connection
-    conn_entries = db.query(models.Connection).all()
-    for c in conn_entries:
-        status_detail = "success" if c.status else "failed"
-        if c.connection_type != "data":
-            status_detail += f"_{c.connection_type}"
-
-        logs.append({
-            "timestamp": c.timestamp,
-            "device_id": c.source_device_id,
-            "activity_type": "malicious" if not c.status else "normal",
-            "description": f"Connection to {c.target_device_id} ({c.connection_type})",
-            "connection_status": status_detail
-        })
-
-    # PeerRating 
-    rating_entries = db.query(models.PeerRating).all()
-    for r in rating_entries:
-        logs.append({
-            "timestamp": r.timestamp,
-            "device_id": r.rater_device_id,
-            "activity_type": "normal",
-            "description": f"Rated {r.rated_device_id} with score {r.score}",
-            "connection_status": "peer_rating"
-        })
-
-    logs.sort(key=lambda x: x["timestamp"], reverse=True)
+    if format == "ndjson":
+        # streaming semua log yang cocok mulai dari cursor; `limit` di sini ukuran halaman query
+        def stream():
+            session = ReadSessionLocal()
+            try:
+                for entry in activity_log.iter_activity(session, page_size=limit, cursor=cursor, **filters):
+                    yield json.dumps(jsonable_encoder(entry)) + "\n"
+            finally:
+                session.close()
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    logs, next_cursor = activity_log.get_activity_page(db, limit=limit, cursor=cursor, **filters)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return logs
 
 @app.get("/reputation/{device_id}", response_model=ReputationInfo)
@@ -235,4 +400,45 @@ def get_reputation_endpoint(device_id: str, session: Session = Depends(get_db)):
     if not reputation_info["exists"]:
         raise HTTPException(status_code=404, detail=f"Device with id {device_id} not found")
         
-    return reputation_info
\ No newline at end of file
+    return reputation_info
+
+# async variant untuk route yang paling sering dipanggil
+@app.post("/async/connect")
+async def connect_device_async(conn: ConnectionCreate, db: AsyncSession = Depends(get_async_db)):
+    try:
+        connection_data = {
+            "source_id": conn.device_id,
+            "target_id": conn.connected_device_id,
+            "status": conn.status,
+            "connection_type": conn.connection_type
+        }
+        return await run_async_write(db, services.record_connection, connection_data)
+
+    except Exception as e:
+        logger.error(f"Async connection error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/async/rate_peer/")
+async def rate_peer_async(rating: PeerRatingCreate, db: AsyncSession = Depends(get_async_db)):
+    try:
+        await run_async_write(
+            db,
+            services.add_peer_rating,
+            rating.rater_device_id,
+            rating.rated_device_id,
+            rating.score,
+            reason=rating.comment,
+            update_trust=rating.update_trust
+        )
+        return {"message": "Peer rating recorded"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/async/reputation/{device_id}", response_model=ReputationInfo)
+async def get_reputation_async(device_id: str, db: AsyncSession = Depends(get_async_db)):
+    reputation_info = await db.run_sync(run_async_path, services.get_device_reputation_info, device_id)
+
+    if not reputation_info["exists"]:
+        raise HTTPException(status_code=404, detail=f"Device with id {device_id} not found")
+
+    return reputation_info
@@ -0,0 +1,294 @@
+# python -m app.migrations [--database-url sqlite:////path/ke/trust_system.db | postgresql://...] [--check-plans]
+
+import argparse
+import json
+import logging
+import re
+import sys
+from datetime import datetime
+from sqlalchemy import create_engine, inspect, select, insert, update, and_, or_, func, text, case, exists
+from . import models, rollups
+from .database import engine as default_engine, make_engine
+
+logger = logging.getLogger(__name__)
+
+# kolom yang ditambahkan setelah skema awal; create_all tidak mengubah tabel yang sudah ada
+ADDED_COLUMNS = [
+    # paling awal: UPDATE devices di backfill lain mengisi updated_at (onupdate)
+    ("devices", "updated_at", "TIMESTAMP"),
+    ("peer_ratings", "connection_id", "INTEGER REFERENCES connections(id)"),
+    ("devices", "inbound_peer_count", "INTEGER DEFAULT 0"),
+    ("trust_history", "event_type", "VARCHAR"),
+]
+
+def backfill_rating_connections(conn):
+    # menautkan rating lama ke koneksi terakhir antara rater dan rated sebelum rating dibuat
+    c = models.Connection.__table__
+    pr = models.PeerRating.__table__
+    last_connection = (
+        select(c.c.id)
+        .where(or_(
+            and_(c.c.source_device_id == pr.c.rater_device_id, c.c.target_device_id == pr.c.rated_device_id),
+            and_(c.c.source_device_id == pr.c.rated_device_id, c.c.target_device_id == pr.c.rater_device_id)
+        ))
+        .where(c.c.timestamp <= pr.c.timestamp)
+        .order_by(c.c.timestamp.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    result = conn.execute(
+        update(pr).where(pr.c.connection_id.is_(None)).values(connection_id=last_connection)
+    )
+    return result.rowcount
+
+def rebuild_inbound_peers(conn):
+    # melengkapi inbound_peers dari tabel connections dan menghitung ulang devices.inbound_peer_count;
+    # baris yang ada tidak dihapus karena koneksinya bisa sudah diarsipkan (app.retention)
+    c = models.Connection.__table__
+    ip = models.InboundPeer.__table__
+    d = models.Device.__table__
+
+    known = exists().where(ip.c.device_id == c.c.target_device_id, ip.c.peer_id == c.c.source_device_id)
+    conn.execute(insert(ip).from_select(
+        ["device_id", "peer_id", "first_seen"],
+        select(c.c.target_device_id, c.c.source_device_id, func.min(c.c.timestamp))
+        .where(c.c.status == True, ~known)
+        .group_by(c.c.target_device_id, c.c.source_device_id)
+    ))
+    result = conn.execute(update(d).values(
+        inbound_peer_count=select(func.count()).where(ip.c.device_id == d.c.id).scalar_subquery()
+    ))
+    return result.rowcount
+
+# klasifikasi notes lama (urutan sama dengan /log_activity sebelumnya), yang pertama cocok dipakai
+HISTORY_EVENT_KEYWORDS = [
+    ("joined", "device_rejoined"),
+    ("left the system", "device_left"),
+    ("blacklist", "blacklisted"),
+    ("dishonest", "dishonest_rating"),
+    ("flooding", "flooding_detected"),
+    ("device registered", "device_registered"),
+    ("elected as new community coordinator", "coordinator_elected"),
+    ("failed to elect", "coordinator_election_failed"),
+]
+
+def backfill_history_event_types(conn):
+    th = models.TrustHistory.__table__
+    notes = func.lower(func.coalesce(th.c.notes, ""))
+    event_type = case(
+        *[(notes.like(f"%{keyword}%"), event) for keyword, event in HISTORY_EVENT_KEYWORDS],
+        else_="trust_updated"
+    )
+    result = conn.execute(update(th).where(th.c.event_type.is_(None)).values(event_type=event_type))
+    return result.rowcount
+
+def backfill_device_updated_at(conn):
+    d = models.Device.__table__
+    result = conn.execute(update(d).where(d.c.updated_at.is_(None)).values(
+        updated_at=func.coalesce(d.c.left_at, d.c.blacklisted_at, d.c.created_at)
+    ))
+    return result.rowcount
+
+def keep_single_coordinator(conn):
+    # database lama bisa punya lebih dari satu koordinator; yang dipertahankan adalah trust tertinggi
+    d = models.Device.__table__
+    keep = conn.execute(
+        select(d.c.id).where(d.c.is_coordinator == True).order_by(d.c.trust_score.desc(), d.c.id).limit(1)
+    ).scalar()
+    result = conn.execute(update(d).where(d.c.is_coordinator == True, d.c.id != keep).values(is_coordinator=False))
+    return result.rowcount
+
+def backfill_suspicious_events(conn):
+    # memindahkan devices.suspicious_reasons (JSON, maksimal 10 terakhir) ke suspicious_events
+    d = models.Device.__table__
+    se = models.SuspiciousEvent.__table__
+    rows = []
+    for device_id, reasons, last_activity in conn.execute(
+        select(d.c.id, d.c.suspicious_reasons, d.c.last_suspicious_activity).where(d.c.suspicious_reasons.isnot(None))
+    ):
+        try:
+            reasons = json.loads(reasons)
+        except ValueError:
+            continue
+        for reason in reasons:
+            try:
+                timestamp = datetime.fromisoformat(reason["timestamp"])
+            except (KeyError, TypeError, ValueError):
+                timestamp = last_activity
+            rows.append({
+                "device_id": device_id,
+                "event_type": reason.get("type"),
+                "timestamp": timestamp,
+                "details": reason.get("details")
+            })
+    if rows:
+        conn.execute(insert(se), rows)
+    return len(rows)
+
+# kolom baru yang perlu diisi untuk data lama
+BACKFILLS = {
+    ("peer_ratings", "connection_id"): backfill_rating_connections,
+    ("devices", "inbound_peer_count"): rebuild_inbound_peers,
+    ("trust_history", "event_type"): backfill_history_event_types,
+    ("devices", "updated_at"): backfill_device_updated_at,
+}
+
+# tabel baru yang diisi dari data lama jika database sudah ada sebelumnya
+TABLE_BACKFILLS = {
+    "suspicious_events": backfill_suspicious_events,
+    "trust_history_rollups": rollups.backfill,
+}
+
+# perbaikan data yang harus dijalankan sebelum index (unique) dibuat
+BEFORE_INDEX = {
+    "uq_devices_single_coordinator": keep_single_coordinator,
+}
+
+def upgrade(bind=None) -> list:
+    """
+    Membuat tabel yang belum ada, menambah kolom dan index baru pada database
+    lama (mis. hasil simulasi di results/), lalu mengisi data untuk kolom baru.
+    """
+    bind = bind or default_engine
+    rollups.check_dialect(bind)
+    existing_tables = set(inspect(bind).get_table_names())
+    models.Base.metadata.create_all(bind=bind)
+
+    applied = []
+    with bind.begin() as conn:
+        # inspector memakai koneksi transaksi ini: di SQLite koneksi kedua akan menunggu lock tulis
+        inspector = inspect(conn)
+        if existing_tables:
+            for table, backfill in TABLE_BACKFILLS.items():
+                if table not in existing_tables:
+                    rows = backfill(conn)
+                    applied.append(f"backfill {table} ({rows} rows)")
+
+        for table, column, ddl in ADDED_COLUMNS:
+            existing = {col["name"] for col in inspector.get_columns(table)}
+            if column in existing:
+                continue
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+            applied.append(f"add column {table}.{column}")
+
+            backfill = BACKFILLS.get((table, column))
+            if backfill:
+                rows = backfill(conn)
+                applied.append(f"backfill {table}.{column} ({rows} rows)")
+
+        # index pada tabel yang sudah ada tidak dibuat oleh create_all
+        for table in models.Base.metadata.sorted_tables:
+            existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    prepare = BEFORE_INDEX.get(index.name)
+                    if prepare:
+                        rows = prepare(conn)
+                        applied.append(f"prepare {index.name} ({rows} rows)")
+                    index.create(conn)
+                    applied.append(f"create index {index.name}")
+
+    return applied
+
+def hot_queries() -> dict:
+    # salinan query yang dijalankan pada setiap interaksi di services.py dan route history;
+    # harus diperbarui jika query di sana berubah
+    c = models.Connection
+    pr = models.PeerRating
+    th = models.TrustHistory
+    d = models.Device
+    se = models.SuspiciousEvent
+    return {
+        "flooding_window": select(func.sum(models.ConnectionRateBucket.count)).where(
+            models.ConnectionRateBucket.source_device_id == "dev-a", models.ConnectionRateBucket.bucket >= 0
+        ),
+        "centrality_peer_check": select(models.InboundPeer).where(
+            models.InboundPeer.device_id == "dev-a", models.InboundPeer.peer_id == "dev-b"
+        ),
+        "last_interaction": select(c).where(or_(
+            and_(c.source_device_id == "dev-a", c.target_device_id == "dev-b"),
+            and_(c.source_device_id == "dev-b", c.target_device_id == "dev-a")
+        )).order_by(c.timestamp.desc()).limit(1),
+        "peer_evaluations": select(pr.score, c.status, pr.rater_device_id).join(
+            c, pr.connection_id == c.id
+        ).where(
+            pr.rated_device_id == "dev-a", pr.rater_device_id != "dev-b"
+        ).order_by(pr.timestamp.desc()).limit(5),
+        "device_history": select(th).where(th.device_id == "dev-a").order_by(th.timestamp.asc()),
+        "previously_blacklisted": select(exists().where(th.device_id == "dev-a", th.event_type == "blacklisted")),
+        "last_device_history": select(th).where(th.device_id == "dev-a").order_by(th.timestamp.desc()).limit(1),
+        "device_history_rollup": select(models.TrustHistoryRollup).where(
+            models.TrustHistoryRollup.device_id == "dev-a", models.TrustHistoryRollup.resolution == "1m",
+            models.TrustHistoryRollup.bucket_start >= datetime(2000, 1, 1)
+        ).order_by(models.TrustHistoryRollup.bucket_start),
+        "coordinator_history": select(th).where(th.coordinator_id == "dev-a").order_by(th.timestamp.asc()),
+        "current_coordinator": select(d).where(d.is_coordinator == True).limit(1),
+        "recent_suspicious_events": select(se).where(se.device_id == "dev-a").order_by(se.timestamp.desc(), se.id.desc()).limit(10),
+        "suspicious_event_counts": select(se.event_type, func.count()).where(
+            se.event_type == "flooding", se.timestamp >= datetime(2000, 1, 1)
+        ),
+    }
+
+# "SCAN connections" (atau "SCAN TABLE connections" pada SQLite lama) tanpa "USING ... INDEX";
+# "SCAN CONSTANT ROW" (SELECT EXISTS(...)) bukan scan tabel
+_FULL_SCAN = re.compile(r"^SCAN (TABLE )?(?!CONSTANT ROW)(\w+)(?!.*\bUSING\b)")
+
+def check_query_plans(bind=None):
+    """
+    Menjalankan EXPLAIN QUERY PLAN untuk setiap hot query dan mengembalikan
+    {nama_query: [tabel yang di-scan penuh]}; dict kosong berarti semua memakai index.
+    Hanya untuk SQLite: dialect lain dilewati dan hasilnya None.
+    """
+    bind = bind or default_engine
+    if bind.dialect.name != "sqlite":
+        logger.warning(f"Query plan check skipped: not implemented for {bind.dialect.name}")
+        return None
+
+    # koneksi baru: koneksi yang baru saja membuat index memakai estimasi jumlah baris
+    # tabel sebenarnya, sehingga tabel kecil bisa tetap di-scan walau index tersedia
+    plan_engine = create_engine(bind.url)
+    full_scans = {}
+    try:
+        with plan_engine.connect() as conn:
+            for name, stmt in hot_queries().items():
+                compiled = stmt.compile(plan_engine)
+                params = tuple(compiled.params[key] for key in compiled.positiontup)
+                plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params)
+                scanned = [m.group(2) for row in plan if (m := _FULL_SCAN.match(row[3]))]
+                if scanned:
+                    full_scans[name] = scanned
+    finally:
+        plan_engine.dispose()
+    return full_scans
+
+def main():
+    parser = argparse.ArgumentParser(description="Upgrade skema database trust system")
+    parser.add_argument("--database-url", help="default: env DATABASE_URL (sqlite atau postgresql)")
+    parser.add_argument("--check-plans", action="store_true", help="gagal jika hot query melakukan full table scan")
+    parser.add_argument("--rebuild-centrality", action="store_true", help="hitung ulang inbound_peers dari connections")
+    args = parser.parse_args()
+
+    bind = make_engine(args.database_url) if args.database_url else default_engine
+    applied = upgrade(bind)
+    for step in applied:
+        print(f"- {step}")
+    print("Schema is up to date." if not applied else f"{len(applied)} migration step(s) applied.")
+
+    if args.rebuild_centrality:
+        with bind.begin() as conn:
+            rows = rebuild_inbound_peers(conn)
+        print(f"Rebuilt inbound_peers, recounted devices.inbound_peer_count ({rows} rows).")
+
+    if args.check_plans:
+        full_scans = check_query_plans(bind)
+        if full_scans is None:
+            print(f"Query plan check skipped: only implemented for SQLite, not {bind.dialect.name}.")
+            return
+        for name, tables in full_scans.items():
+            print(f"FULL SCAN: {name} scans {', '.join(tables)}")
+        if full_scans:
+            sys.exit(1)
+        print("All hot queries use an index.")
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, ForeignKey, Text, Index, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -22,11 +22,14 @@ class Device(Base):
     is_active = Column(Boolean, default=True)
     left_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # diperbarui setiap kali baris device berubah; dipakai untuk ETag /devices/
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     blacklisted_at = Column(DateTime, nullable=True)
     suspicious_count = Column(Integer, default=0)
     is_flagged = Column(Boolean, default=False)
     last_suspicious_activity = Column(DateTime, nullable=True)
-    suspicious_reasons = Column(Text, nullable=True)                                  
+    suspicious_reasons = Column(Text, nullable=True)  # lama (JSON); diganti tabel suspicious_events
+    inbound_peer_count = Column(Integer, default=0)  # jumlah source unik dengan koneksi sukses (centrality)
 
     trust_history = relationship("TrustHistory", back_populates="device", cascade="all, delete-orphan", foreign_keys="[TrustHistory.device_id]")
     connections_initiated = relationship("Connection", back_populates="source_device", foreign_keys='Connection.source_device_id')
@@ -34,6 +37,31 @@ class Device(Base):
     ratings_given = relationship("PeerRating", back_populates="rater", foreign_keys='PeerRating.rater_device_id')
     ratings_received = relationship("PeerRating", back_populates="rated", foreign_keys='PeerRating.rated_device_id')
 
+    __table_args__ = (
+        # lookup koordinator aktif
+        Index("ix_devices_is_coordinator", "is_coordinator"),
+        # ETag /devices/: perubahan terakhir
+        Index("ix_devices_updated_at", "updated_at"),
+        # paling banyak satu koordinator, juga jika pemilihan berjalan di beberapa worker
+        Index(
+            "uq_devices_single_coordinator", "is_coordinator", unique=True,
+            sqlite_where=text("is_coordinator = 1"), postgresql_where=text("is_coordinator")
+        ),
+    )
+
+# jenis event di trust_history, diisi oleh fungsi yang menulis baris tersebut di services.py
+TRUST_EVENT_TYPES = (
+    "device_registered",
+    "device_rejoined",
+    "device_left",
+    "trust_updated",
+    "dishonest_rating",
+    "flooding_detected",
+    "blacklisted",
+    "coordinator_elected",
+    "coordinator_election_failed",
+)
+
 class TrustHistory(Base):
     __tablename__ = "trust_history"
 
@@ -44,6 +72,8 @@ class TrustHistory(Base):
     connection_count = Column(Integer)
     last_connected_device_id = Column(String, ForeignKey("devices.id"))
     notes = Column(Text)
+    # salah satu TRUST_EVENT_TYPES
+    event_type = Column(String, default="trust_updated")
     coordinator_id = Column(String, ForeignKey("devices.id"))
     direct_trust = Column(Float)
     indirect_trust = Column(Float)
@@ -52,6 +82,30 @@ class TrustHistory(Base):
     device = relationship("Device", back_populates="trust_history", foreign_keys=[device_id])
     coordinator = relationship("Device", viewonly=True, foreign_keys=[coordinator_id])
 
+    __table_args__ = (
+        # /device/{id}/history dan check_device_history
+        Index("ix_trust_history_device_timestamp", "device_id", "timestamp"),
+        # check_device_history: pernah di-blacklist
+        Index("ix_trust_history_device_event_type", "device_id", "event_type"),
+        # /coordinator/{id}/history
+        Index("ix_trust_history_coordinator_timestamp", "coordinator_id", "timestamp"),
+        # /log_activity: halaman terbaru tanpa filter device
+        Index("ix_trust_history_timestamp", "timestamp"),
+    )
+
+class TrustHistoryRollup(Base):
+    # ringkasan trust_history per device per bucket waktu (1s, 1m, 1h); dipelihara oleh app/rollups.py
+    __tablename__ = "trust_history_rollups"
+
+    device_id = Column(String, ForeignKey("devices.id"), primary_key=True)
+    resolution = Column(String, primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    min_trust = Column(Float)
+    max_trust = Column(Float)
+    last_trust = Column(Float)
+    last_timestamp = Column(DateTime)
+    count = Column(Integer, default=0)
+
 
 class Connection(Base):
     __tablename__ = "connections"
@@ -66,6 +120,17 @@ class Connection(Base):
     source_device = relationship("Device", back_populates="connections_initiated", foreign_keys=[source_device_id])
     target_device = relationship("Device", back_populates="connections_received", foreign_keys=[target_device_id])
 
+    __table_args__ = (
+        # handle_flooding_check: koneksi dari source dalam periode terakhir
+        Index("ix_connections_source_timestamp", "source_device_id", "timestamp"),
+        # centrality: source unik yang sukses terhubung ke target (covering index)
+        Index("ix_connections_target_status_source", "target_device_id", "status", "source_device_id"),
+        # add_peer_rating: interaksi terakhir antara dua device
+        Index("ix_connections_pair_timestamp", "source_device_id", "target_device_id", "timestamp"),
+        # /log_activity
+        Index("ix_connections_timestamp", "timestamp"),
+    )
+
 class PeerRating(Base):
     __tablename__ = "peer_ratings"
 
@@ -75,6 +140,57 @@ class PeerRating(Base):
     timestamp = Column(DateTime, default=datetime.utcnow)
     score = Column(Float)  # 0.0 - 1.0
     comment = Column(Text, nullable=True)
+    connection_id = Column(Integer, ForeignKey("connections.id"), nullable=True)  # interaksi terakhir yang dinilai
 
     rater = relationship("Device", back_populates="ratings_given", foreign_keys=[rater_device_id])
-    rated = relationship("Device", back_populates="ratings_received", foreign_keys=[rated_device_id])
\ No newline at end of file
+    rated = relationship("Device", back_populates="ratings_received", foreign_keys=[rated_device_id])
+    connection = relationship("Connection", foreign_keys=[connection_id])
+
+    __table_args__ = (
+        # update_trust_score: 5 evaluasi terbaru untuk device yang dinilai
+        Index("ix_peer_ratings_rated_timestamp", "rated_device_id", "timestamp"),
+        # rating terakhir antara pasangan rater dan rated
+        Index("ix_peer_ratings_rater_rated_timestamp", "rater_device_id", "rated_device_id", "timestamp"),
+        # /log_activity
+        Index("ix_peer_ratings_timestamp", "timestamp"),
+    )
+
+class SuspiciousEvent(Base):
+    # aktivitas mencurigakan per device (badmouthing, collusion, flooding); hanya ditambah, tidak diubah
+    __tablename__ = "suspicious_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    device_id = Column(String, ForeignKey("devices.id"))
+    event_type = Column(String)
+    timestamp = Column(DateTime, default=datetime.utcnow)
+    details = Column(Text, nullable=True)
+
+    __table_args__ = (
+        # event terbaru per device (reputasi)
+        Index("ix_suspicious_events_device_timestamp", "device_id", "timestamp"),
+        # jumlah event per tipe dalam rentang waktu
+        Index("ix_suspicious_events_type_timestamp", "event_type", "timestamp"),
+    )
+
+class InboundPeer(Base):
+    # source unik yang pernah sukses terhubung ke device; dipelihara oleh record_connection
+    __tablename__ = "inbound_peers"
+
+    device_id = Column(String, ForeignKey("devices.id"), primary_key=True)
+    peer_id = Column(String, ForeignKey("devices.id"), primary_key=True)
+    first_seen = Column(DateTime, default=datetime.utcnow)
+
+class ConnectionRateBucket(Base):
+    # counter flooding per slot waktu, dipakai jika FLOOD_COUNTER_BACKEND=database
+    __tablename__ = "connection_rate_buckets"
+
+    source_device_id = Column(String, primary_key=True)
+    bucket = Column(Integer, primary_key=True)  # floor(epoch / panjang slot)
+    count = Column(Integer, default=0)
+
+class SystemState(Base):
+    # nilai global kecil yang dibaca bersama oleh semua worker, mis. epoch koordinator
+    __tablename__ = "system_state"
+
+    key = Column(String, primary_key=True)
+    value = Column(Integer, default=0)
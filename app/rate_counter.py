@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+from sqlalchemy import delete, func
+from sqlalchemy.orm import Session
+from .models import ConnectionRateBucket
+
+# jumlah koneksi per source dalam FLOOD_WINDOW_SECONDS terakhir, dipakai oleh handle_flooding_check
+FLOOD_WINDOW_SECONDS = float(os.getenv("FLOOD_WINDOW_SECONDS", "10"))
+# resolusi ring buffer: window dibagi menjadi sejumlah slot
+FLOOD_WINDOW_SLOTS = int(os.getenv("FLOOD_WINDOW_SLOTS", "100"))
+# memory   -> counter per proses (satu worker backend)
+# database -> counter di tabel connection_rate_buckets, konsisten antar worker
+FLOOD_COUNTER_BACKEND = os.getenv("FLOOD_COUNTER_BACKEND", "memory").lower()
+
+class _Ring:
+    __slots__ = ("counts", "head_slot", "total")
+
+    def __init__(self, slots: int, head_slot: int):
+        self.counts = [0] * slots
+        self.head_slot = head_slot
+        self.total = 0
+
+class SlidingWindowCounter:
+    # ring buffer per source dengan FLOOD_WINDOW_SLOTS slot: memori tetap per source
+    # dan biaya count/record O(1) berapapun jumlah koneksi dalam window
+    def __init__(self, window_seconds: float = FLOOD_WINDOW_SECONDS, slots: int = FLOOD_WINDOW_SLOTS, clock=time.monotonic):
+        self.window_seconds = window_seconds
+        self.slots = slots
+        self.slot_seconds = window_seconds / slots
+        self.clock = clock
+        self._rings = {}
+        self._lock = threading.Lock()
+        self._ops = 0
+
+    def _current_slot(self) -> int:
+        return int(self.clock() / self.slot_seconds)
+
+    def _advance(self, ring: _Ring, slot: int):
+        elapsed = slot - ring.head_slot
+        if elapsed <= 0:
+            return
+        if elapsed >= self.slots:
+            ring.counts = [0] * self.slots
+            ring.total = 0
+        else:
+            for s in range(ring.head_slot + 1, slot + 1):
+                idx = s % self.slots
+                ring.total -= ring.counts[idx]
+                ring.counts[idx] = 0
+        ring.head_slot = slot
+
+    def count(self, key: str, session: Session = None) -> int:
+        with self._lock:
+            ring = self._rings.get(key)
+            if ring is None:
+                return 0
+            self._advance(ring, self._current_slot())
+            return ring.total
+
+    def record(self, key: str, session: Session = None):
+        with self._lock:
+            slot = self._current_slot()
+            ring = self._rings.get(key)
+            if ring is None:
+                ring = self._rings[key] = _Ring(self.slots, slot)
+            self._advance(ring, slot)
+            ring.counts[slot % self.slots] += 1
+            ring.total += 1
+
+            self._ops += 1
+            if self._ops % 1024 == 0:
+                self._evict_idle(slot)
+
+    def _evict_idle(self, slot: int):
+        # source yang tidak aktif lebih dari satu window tidak perlu disimpan
+        idle = [key for key, ring in self._rings.items() if slot - ring.head_slot >= self.slots]
+        for key in idle:
+            del self._rings[key]
+
+    def reset(self):
+        with self._lock:
+            self._rings.clear()
+
+class DatabaseWindowCounter:
+    # slot yang sama dengan SlidingWindowCounter, disimpan di database agar dipakai bersama oleh semua worker
+    def __init__(self, window_seconds: float = FLOOD_WINDOW_SECONDS, slots: int = FLOOD_WINDOW_SLOTS, clock=time.time):
+        self.window_seconds = window_seconds
+        self.slots = slots
+        self.slot_seconds = window_seconds / slots
+        self.clock = clock
+
+    def _current_slot(self) -> int:
+        return int(self.clock() / self.slot_seconds)
+
+    def count(self, key: str, session: Session) -> int:
+        oldest = self._current_slot() - self.slots + 1
+        return session.query(func.coalesce(func.sum(ConnectionRateBucket.count), 0)).filter(
+            ConnectionRateBucket.source_device_id == key,
+            ConnectionRateBucket.bucket >= oldest
+        ).scalar()
+
+    def record(self, key: str, session: Session):
+        slot = self._current_slot()
+        dialect = session.get_bind().dialect.name
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+
+        stmt = insert(ConnectionRateBucket).values(source_device_id=key, bucket=slot, count=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ConnectionRateBucket.source_device_id, ConnectionRateBucket.bucket],
+            set_={"count": ConnectionRateBucket.count + 1}
+        )
+        session.execute(stmt)
+        # bucket di luar window dihapus agar tabel tetap kecil
+        session.execute(delete(ConnectionRateBucket).where(
+            ConnectionRateBucket.source_device_id == key,
+            ConnectionRateBucket.bucket <= slot - self.slots
+        ))
+
+_counter = None
+_counter_lock = threading.Lock()
+
+def get_flood_counter():
+    global _counter
+    if _counter is None:
+        with _counter_lock:
+            if _counter is None:
+                if FLOOD_COUNTER_BACKEND == "database":
+                    _counter = DatabaseWindowCounter()
+                elif FLOOD_COUNTER_BACKEND == "memory":
+                    _counter = SlidingWindowCounter()
+                else:
+                    raise ValueError(f"Unknown FLOOD_COUNTER_BACKEND '{FLOOD_COUNTER_BACKEND}', expected 'memory' or 'database'")
+    return _counter
+
+def set_flood_counter(counter):
+    # mis. untuk replay dengan clock virtual
+    global _counter
+    _counter = counter
@@ -0,0 +1,159 @@
+# python -m app.retention [--database-url ...] [--archive-dir /data/archive] [--dry-run]
+#
+# Memindahkan baris lama dari connections, peer_ratings dan trust_history ke file segmen
+# JSONL terkompresi (gzip). Baris yang masih dibutuhkan oleh perhitungan trust tetap di
+# database sebagai ringkasan:
+# - connections: interaksi terakhir setiap pasangan device (add_peer_rating) dan koneksi
+#   yang dirujuk rating yang masih ada (peer_evaluations); peer unik per device sudah ada
+#   di inbound_peers
+# - peer_ratings: RETENTION_KEEP_RATINGS rating terbaru untuk setiap pasangan rater dan
+#   device yang dinilai
+# - trust_history: baris terbaru setiap device (trust saat rejoin) dan semua baris
+#   "blacklisted" (penanda untuk check_device_history); grafik lama tetap tersedia dari
+#   trust_history_rollups
+
+import argparse
+import gzip
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, exists, func, and_, or_
+from sqlalchemy.orm import aliased
+from . import models
+from .database import engine as default_engine, make_engine
+
+RETENTION_CONNECTIONS_DAYS = float(os.getenv("RETENTION_CONNECTIONS_DAYS", "30"))
+RETENTION_RATINGS_DAYS = float(os.getenv("RETENTION_RATINGS_DAYS", "30"))
+RETENTION_HISTORY_DAYS = float(os.getenv("RETENTION_HISTORY_DAYS", "30"))
+# peer_evaluations membaca 5 rating terbaru selain dari peer yang sedang berinteraksi;
+# rating yang bisa masuk ke sana (untuk peer mana pun) selalu termasuk 5 rating terbaru
+# dari rater yang sama, sehingga cukup disimpan per pasangan (rated, rater)
+RETENTION_KEEP_RATINGS = max(5, int(os.getenv("RETENTION_KEEP_RATINGS", "5")))
+RETENTION_ARCHIVE_DIR = os.getenv("RETENTION_ARCHIVE_DIR", "/data/archive")
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "5000"))
+
+logger = logging.getLogger(__name__)
+
+def archivable_ratings(cutoff: datetime):
+    pr = models.PeerRating.__table__
+    newer = aliased(pr)
+    newer_count = (
+        select(func.count())
+        .where(
+            newer.c.rated_device_id == pr.c.rated_device_id,
+            newer.c.rater_device_id == pr.c.rater_device_id,
+            newer.c.timestamp > pr.c.timestamp
+        )
+        .scalar_subquery()
+    )
+    return pr, [pr.c.timestamp < cutoff, newer_count >= RETENTION_KEEP_RATINGS]
+
+def archivable_connections(cutoff: datetime):
+    c = models.Connection.__table__
+    pr = models.PeerRating.__table__
+    newer = aliased(c)
+    same_pair = or_(
+        and_(newer.c.source_device_id == c.c.source_device_id, newer.c.target_device_id == c.c.target_device_id),
+        and_(newer.c.source_device_id == c.c.target_device_id, newer.c.target_device_id == c.c.source_device_id),
+    )
+    superseded = exists().where(
+        same_pair,
+        or_(newer.c.timestamp > c.c.timestamp, and_(newer.c.timestamp == c.c.timestamp, newer.c.id > c.c.id))
+    )
+    referenced = exists().where(pr.c.connection_id == c.c.id)
+    return c, [c.c.timestamp < cutoff, superseded, ~referenced]
+
+def archivable_history(cutoff: datetime):
+    th = models.TrustHistory.__table__
+    newer = aliased(th)
+    superseded = exists().where(
+        newer.c.device_id == th.c.device_id,
+        or_(newer.c.timestamp > th.c.timestamp, and_(newer.c.timestamp == th.c.timestamp, newer.c.id > th.c.id))
+    )
+    return th, [
+        th.c.timestamp < cutoff,
+        func.coalesce(th.c.event_type, "") != "blacklisted",
+        # baris sistem tanpa device (mis. pemilihan koordinator gagal) cukup berdasarkan umur
+        or_(th.c.device_id.is_(None), superseded),
+    ]
+
+def write_segment(archive_dir: str, table_name: str, rows: list) -> str:
+    # satu file per batch; ditulis dan di-fsync sebelum baris dihapus dari database
+    directory = os.path.join(archive_dir, table_name)
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    path = os.path.join(directory, f"{table_name}-{stamp}-{rows[0]['id']}-{rows[-1]['id']}.jsonl.gz")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+            for row in rows:
+                gz.write((json.dumps(row, default=_to_json) + "\n").encode())
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp_path, path)
+    return path
+
+def _to_json(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot archive value of type {type(value).__name__}")
+
+def archive_table(bind, table, conditions, archive_dir: str, batch_size: int = RETENTION_BATCH_SIZE, dry_run: bool = False) -> dict:
+    """
+    Mengarsipkan baris yang memenuhi conditions per batch (urut id): segmen ditulis dulu,
+    lalu baris dihapus dalam transaksi yang sama dengan pemilihannya. Jika proses berhenti
+    di antaranya, batch yang sama diarsipkan ulang pada run berikutnya.
+    """
+    if dry_run:
+        with bind.connect() as conn:
+            rows = conn.execute(select(func.count()).select_from(table).where(*conditions)).scalar()
+        return {"rows": rows, "segments": []}
+
+    archived, segments, last_id = 0, [], 0
+    while True:
+        with bind.begin() as conn:
+            rows = conn.execute(
+                select(table).where(table.c.id > last_id, *conditions).order_by(table.c.id).limit(batch_size)
+            ).mappings().all()
+            if not rows:
+                break
+            rows = [dict(row) for row in rows]
+            segments.append(write_segment(archive_dir, table.name, rows))
+            ids = [row["id"] for row in rows]
+            conn.execute(delete(table).where(table.c.id.in_(ids)))
+        archived += len(rows)
+        last_id = ids[-1]
+        logger.info(f"Archived {len(rows)} rows from {table.name} to {segments[-1]}")
+    return {"rows": archived, "segments": segments}
+
+def run_retention(bind=None, archive_dir: str = RETENTION_ARCHIVE_DIR, now: datetime = None, dry_run: bool = False) -> dict:
+    bind = bind or default_engine
+    now = now or datetime.utcnow()
+    # rating lebih dulu: koneksi yang hanya dirujuk rating lama ikut bisa diarsipkan
+    plan = [
+        archivable_ratings(now - timedelta(days=RETENTION_RATINGS_DAYS)),
+        archivable_connections(now - timedelta(days=RETENTION_CONNECTIONS_DAYS)),
+        archivable_history(now - timedelta(days=RETENTION_HISTORY_DAYS)),
+    ]
+    return {
+        table.name: archive_table(bind, table, conditions, archive_dir, dry_run=dry_run)
+        for table, conditions in plan
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Arsipkan baris lama connections, peer_ratings dan trust_history")
+    parser.add_argument("--database-url", help="default: env DATABASE_URL (sqlite atau postgresql)")
+    parser.add_argument("--archive-dir", default=RETENTION_ARCHIVE_DIR)
+    parser.add_argument("--dry-run", action="store_true", help="hanya hitung baris yang akan diarsipkan")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    bind = make_engine(args.database_url) if args.database_url else default_engine
+    result = run_retention(bind, archive_dir=args.archive_dir, dry_run=args.dry_run)
+    for table, info in result.items():
+        action = "would archive" if args.dry_run else "archived"
+        print(f"{table}: {action} {info['rows']} rows in {len(info['segments'])} segment(s)")
+
+if __name__ == "__main__":
+    main()
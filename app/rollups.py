@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta
+from sqlalchemy import event, select, case, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from .models import TrustHistory, TrustHistoryRollup
+
+# resolusi rollup -> panjang bucket dalam detik
+RESOLUTIONS = {"1s": 1, "1m": 60, "1h": 3600}
+
+# baris trust_history yang dibaca per batch saat backfill
+BACKFILL_BATCH_SIZE = 5000
+
+# INSERT ... ON CONFLICT DO UPDATE dan fungsi min/max dua nilai per dialect
+_UPSERT_DIALECTS = {
+    "postgresql": (postgresql.insert, func.least, func.greatest),
+    "sqlite": (sqlite.insert, func.min, func.max),
+}
+
+def check_dialect(bind):
+    # dipanggil sekali saat startup (migrations.upgrade), bukan di hook after_flush
+    if bind.dialect.name not in _UPSERT_DIALECTS:
+        raise RuntimeError(
+            f"Trust history rollups are not implemented for {bind.dialect.name} "
+            f"(supported: {', '.join(_UPSERT_DIALECTS)})"
+        )
+
+def bucket_start(timestamp: datetime, seconds: int) -> datetime:
+    offset = (timestamp.hour * 3600 + timestamp.minute * 60 + timestamp.second) % seconds
+    return timestamp.replace(microsecond=0) - timedelta(seconds=offset)
+
+def aggregate(rows) -> list:
+    """
+    rows: [(device_id, timestamp, trust_score), ...] -> satu baris rollup per
+    (device_id, resolution, bucket_start) dengan min/max/last trust dan jumlah event.
+    """
+    buckets = {}
+    for device_id, timestamp, trust_score in rows:
+        if device_id is None or timestamp is None or trust_score is None:
+            continue
+        for resolution, seconds in RESOLUTIONS.items():
+            key = (device_id, resolution, bucket_start(timestamp, seconds))
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = {
+                    "device_id": device_id,
+                    "resolution": resolution,
+                    "bucket_start": key[2],
+                    "min_trust": trust_score,
+                    "max_trust": trust_score,
+                    "last_trust": trust_score,
+                    "last_timestamp": timestamp,
+                    "count": 1,
+                }
+                continue
+            bucket["min_trust"] = min(bucket["min_trust"], trust_score)
+            bucket["max_trust"] = max(bucket["max_trust"], trust_score)
+            if timestamp >= bucket["last_timestamp"]:
+                bucket["last_trust"] = trust_score
+                bucket["last_timestamp"] = timestamp
+            bucket["count"] += 1
+    return list(buckets.values())
+
+def upsert(connection, buckets: list):
+    # menggabungkan bucket dengan baris rollup yang sudah ada (INSERT ... ON CONFLICT DO UPDATE)
+    if not buckets:
+        return
+    insert, smaller, larger = _UPSERT_DIALECTS[connection.dialect.name]
+    stmt = insert(TrustHistoryRollup)
+
+    table, new = TrustHistoryRollup.__table__.c, stmt.excluded
+    newer = new.last_timestamp >= table.last_timestamp
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.device_id, table.resolution, table.bucket_start],
+        set_={
+            "min_trust": smaller(table.min_trust, new.min_trust),
+            "max_trust": larger(table.max_trust, new.max_trust),
+            "last_trust": case((newer, new.last_trust), else_=table.last_trust),
+            "last_timestamp": case((newer, new.last_timestamp), else_=table.last_timestamp),
+            "count": table.count + new.count,
+        }
+    )
+    connection.execute(stmt, buckets)
+
+def get_history(session: Session, device_id: str, resolution: str, since: datetime = None, until: datetime = None) -> list:
+    # satu baris per bucket, urut waktu; trust_score adalah trust terakhir di bucket
+    stmt = select(TrustHistoryRollup).where(
+        TrustHistoryRollup.device_id == device_id,
+        TrustHistoryRollup.resolution == resolution
+    )
+    if since is not None:
+        stmt = stmt.where(TrustHistoryRollup.bucket_start >= bucket_start(since, RESOLUTIONS[resolution]))
+    if until is not None:
+        stmt = stmt.where(TrustHistoryRollup.bucket_start < until)
+    return [
+        {
+            "timestamp": r.bucket_start,
+            "trust_score": r.last_trust,
+            "min_trust": r.min_trust,
+            "max_trust": r.max_trust,
+            "last_timestamp": r.last_timestamp,
+            "count": r.count,
+        }
+        for r in session.execute(stmt.order_by(TrustHistoryRollup.bucket_start)).scalars()
+    ]
+
+def backfill(connection) -> int:
+    # membangun rollup dari trust_history yang sudah ada, dibaca per batch berdasarkan id
+    th = TrustHistory.__table__.c
+    last_id, rows_read = 0, 0
+    while True:
+        rows = connection.execute(
+            select(th.id, th.device_id, th.timestamp, th.trust_score)
+            .where(th.id > last_id)
+            .order_by(th.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            return rows_read
+        upsert(connection, aggregate((r.device_id, r.timestamp, r.trust_score) for r in rows))
+        last_id = rows[-1].id
+        rows_read += len(rows)
+
+# baris trust_history baru digabung ke rollup dalam transaksi yang sama
+@event.listens_for(Session, "after_flush")
+def _rollup_new_history(session, flush_context):
+    rows = [
+        (obj.device_id, obj.timestamp, obj.trust_score)
+        for obj in session.new if isinstance(obj, TrustHistory)
+    ]
+    if rows:
+        upsert(session.connection(), aggregate(rows))
@@ -1,13 +1,27 @@
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
-from .models import Device, Connection, TrustHistory, PeerRating
+from .models import Device, Connection, TrustHistory, PeerRating, InboundPeer, SystemState, SuspiciousEvent
+from .trust_engine import get_trust_engine, load_trust_logic, TrustEngineUnavailable
+from .rate_counter import get_flood_counter
+from .cache import device_cache, coordinator_slot, COORDINATOR_EPOCH_KEY
+from .election import CandidateRanking, track_candidates
+from .events import stage_event
+from . import rollups  # hook rollup trust_history
 import requests
-from sqlalchemy import case, select, func
+from sqlalchemy import select, exists, func, text, cast, Integer
+from sqlalchemy.orm.util import identity_key
 import logging
 import os
 
-TRUST_SERVICE_URL = os.getenv("TRUST_SERVICE_URL", "http://localhost:8001")
 TRUST_THRESHOLD = 0.3
+# kunci advisory PostgreSQL untuk pemilihan koordinator (nilai bebas, sama di semua worker)
+COORDINATOR_ELECTION_LOCK = 7021
+# log lengkap (DEBUG) selain console
+LOG_FILE = os.getenv("LOG_FILE", "/data/logs.log")
+
+# kandidat koordinator, diperbarui setiap kali device berubah
+coordinator_ranking = CandidateRanking(min_trust=TRUST_THRESHOLD)
+track_candidates(coordinator_ranking)
 
 def setup_logger():
     logger = logging.getLogger(__name__)
@@ -30,7 +44,7 @@ def setup_logger():
     logger.addHandler(console_handler)
     
     # File handler 
-    file_handler = logging.FileHandler('/data/logs.log')
+    file_handler = logging.FileHandler(LOG_FILE)
     file_handler.setLevel(logging.DEBUG)
     file_handler.setFormatter(formatter)
     logger.addHandler(file_handler)
@@ -45,129 +59,176 @@ def evaluate_security(device_id: str, conn_count_last_period: int, session: Sess
         return {"penalty": 0.0, "blacklisted": False}
     
     try:
-        res = requests.post(f"{TRUST_SERVICE_URL}/security/evaluate", json={
+        return get_trust_engine().evaluate_security({
             "source_id": device_id,
             "conn_count_last_period": conn_count_last_period,
             "is_coordinator": device.is_coordinator
         })
-        res.raise_for_status()  
-        return res.json() 
     
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, TrustEngineUnavailable) as e:
         logger.error(f"Failed to call trust service for security evaluation: {e}")
         return {"penalty": 0.0, "threshold_used": 0}
 
+def lock_devices(session: Session, device_ids) -> dict:
+    # SELECT ... FOR UPDATE dalam urutan id agar dua worker tidak saling menunggu (deadlock);
+    # populate_existing memastikan nilai di session adalah nilai terbaru setelah lock didapat
+    ids = sorted({device_id for device_id in device_ids if device_id})
+    if not ids:
+        return {}
+    # SQLite tidak punya row lock (FOR UPDATE diabaikan); di sana transaksi sudah memegang
+    # lock tulis database sejak BEGIN IMMEDIATE (database._begin_sqlite_transaction)
+    devices = session.query(Device).filter(Device.id.in_(ids)).order_by(Device.id)\
+        .with_for_update().populate_existing().all()
+    return {device.id: device for device in devices}
+
+def lock_coordinator_election(session: Session):
+    # satu pemilihan koordinator dalam satu waktu di semua worker, dilepas saat commit/rollback
+    if session.get_bind().dialect.name == "postgresql":
+        session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": COORDINATOR_ELECTION_LOCK})
+
+def get_coordinator_id(session: Session):
+    # dari coordinator_slot, tanpa query selama epoch koordinator tidak berubah
+    return coordinator_slot.get(session)
+
 def ensure_valid_coordinator(session: Session):
-    current = session.query(Device).filter_by(is_coordinator=True).first()
+    coordinator_id = get_coordinator_id(session)
+    current = device_states(session, [coordinator_id]).get(coordinator_id) if coordinator_id else None
     if current and not current.is_blacklisted and current.trust_score >= TRUST_THRESHOLD:
         return current
-    old_coordinator_id = current.id if current else None
-    return select_coordinator(session, old_coordinator_id=old_coordinator_id)
+    return select_coordinator(session, old_coordinator_id=coordinator_id)
 
-def update_trust_score(session: Session, device: Device, peer: Device, success: bool):
-    if device.is_blacklisted:
-        logger.debug(f"SKIP_UPDATE: Device {device.id} is blacklisted, skipping trust update")
-        return
-    
-    if peer.is_blacklisted:
-        logger.debug(f"SKIP_UPDATE: Peer {peer.id} is blacklisted, skipping trust update for {device.id}")
-        return
-    
-    # mengambil 5 rating terbaru selain dari peer saat ini
-    subquery = (
-        select(Connection.status)
-        .correlate(PeerRating)
-        .where(
-            ((Connection.source_device_id == PeerRating.rater_device_id) & (Connection.target_device_id == PeerRating.rated_device_id)) |
-            ((Connection.source_device_id == PeerRating.rated_device_id) & (Connection.target_device_id == PeerRating.rater_device_id))
-        )
-        .where (Connection.timestamp <= PeerRating.timestamp)
-        .order_by(Connection.timestamp.desc())
-        .limit(1)
-        .as_scalar()
-    )
-    
+def _peer_evaluations(session: Session, device: Device, peer_id: str) -> list:
+    # mengambil 5 rating terbaru selain dari peer saat ini, beserta status interaksi yang dinilai
     results = session.query(
         PeerRating.score,
-        subquery.label("connection_status"),
+        Connection.status,
         PeerRating.rater_device_id
+    ).join(
+        Connection, PeerRating.connection_id == Connection.id
     ).filter(
         PeerRating.rated_device_id == device.id,
-        PeerRating.rater_device_id != peer.id,
-        subquery != None
+        PeerRating.rater_device_id != peer_id
     ).order_by(PeerRating.timestamp.desc()).limit(5).all()
     
+    raters = device_states(session, [rater_id for _, _, rater_id in results])
     peer_evaluations = []
     for score, status, rater_id in results:
-        rater = session.get(Device, rater_id)
-        rater_reputation = get_reputation_level(rater)
+        rater_reputation = get_reputation_level(raters[rater_id])
         peer_evaluations.append({
             "rating_score": score,
             "interaction_was_successful": status,
             "rater_reputation": rater_reputation
         })
+    return peer_evaluations
 
-    # centrality dari jumlah source unik
-    successful_peers_q = session.query(Connection.source_device_id)\
-        .filter(Connection.target_device_id == device.id)\
-        .filter(Connection.status == True)\
-        .distinct()
+def _centrality_raw(session: Session, device: Device, peer: Device, success: bool) -> int:
+    # centrality dari jumlah source unik (dipelihara oleh record_connection)
+    centrality_raw = device.inbound_peer_count or 0
 
-    db_successful_peers = {row[0] for row in successful_peers_q.all()}
+    # menambahkan peer saat ini jika koneksi sukses dan belum tercatat
+    if success and session.get(InboundPeer, (device.id, peer.id)) is None:
+        centrality_raw += 1
+    return centrality_raw
 
-    # menambahkan peer saat ini jika koneksi sukses
-    if success:
-        db_successful_peers.add(peer.id)
+def _prepare_trust_update(session: Session, device: Device, peer: Device, success: bool):
+    if device.is_blacklisted:
+        logger.debug(f"SKIP_UPDATE: Device {device.id} is blacklisted, skipping trust update")
+        return None
     
-    centrality_raw = len(db_successful_peers)
-
-    # mengirim ke trust service
-    try:
-        start_eval = datetime.utcnow()
-        evaluatin_context = "DEFAULT"
-        res = requests.post(f"{TRUST_SERVICE_URL}/trust/calculate", json={
-            "last_trust": device.trust_score,
-            "success": success,
-            "peer_evaluations": peer_evaluations,
-            "centrality_raw": centrality_raw,
-            "rated_reputation": get_reputation_level(device),
-            "interaction_count": device.connection_count
-        })
-        result = res.json()
+    if peer.is_blacklisted:
+        logger.debug(f"SKIP_UPDATE: Peer {peer.id} is blacklisted, skipping trust update for {device.id}")
+        return None
 
-        end_eval = datetime.utcnow()
-        eval_duration = (end_eval - start_eval).total_seconds()
+    return {
+        "last_trust": device.trust_score,
+        "success": success,
+        "peer_evaluations": _peer_evaluations(session, device, peer.id),
+        "centrality_raw": _centrality_raw(session, device, peer, success),
+        "rated_reputation": get_reputation_level(device),
+        "interaction_count": device.connection_count
+    }
 
-        device.trust_score = result["updated_trust"]
-        device.is_blacklisted = result["blacklisted"]
+def _interaction_state(session: Session, device: Device, peer: Device, success: bool) -> dict:
+    # centrality dan jumlah interaksi device tepat setelah interaksi ini dicatat; diambil saat
+    # interaksi diproses agar interaksi berikutnya di batch yang sama tidak ikut terhitung
+    return {
+        "centrality_raw": _centrality_raw(session, device, peer, success),
+        "interaction_count": device.connection_count
+    }
 
-        # blacklist event
-        if result["blacklisted"]:
-            device.blacklisted_at = datetime.utcnow() 
-            detection_time = (device.blacklisted_at - device.created_at).total_seconds()
-            logger.warning(f"BLACKLIST: Device {device.id} blacklisted after evaluation {eval_duration:.3f}s with detection time: {detection_time:.3f} after joined")
-        else:
-            logger.info(f"SAFE: Device {device.id} passed evaluation (duration {eval_duration:.3f}s)")
+def _prepare_trust_sequence(session: Session, device: Device, interactions: list):
+    # semua interaksi device dalam satu batch sebagai step berurutan untuk evaluate_trust_sequences
+    if device.is_blacklisted:
+        logger.debug(f"SKIP_UPDATE: Device {device.id} is blacklisted, skipping trust update")
+        return None, []
 
-        # menyimpan history
-        coordinator = session.query(Device).filter_by(is_coordinator=True).first()
-        coordinator_id = coordinator.id if coordinator else None
+    included = []
+    for peer, success, state in interactions:
+        if peer.is_blacklisted:
+            logger.debug(f"SKIP_UPDATE: Peer {peer.id} is blacklisted, skipping trust update for {device.id}")
+            continue
+        included.append((peer, success, state or _interaction_state(session, device, peer, success)))
+    if not included:
+        return None, []
+
+    evaluations = {}
+    steps = []
+    for peer, success, state in included:
+        if peer.id not in evaluations:
+            evaluations[peer.id] = _peer_evaluations(session, device, peer.id)
+        steps.append({
+            "success": success,
+            "peer_evaluations": evaluations[peer.id],
+            "centrality_raw": state["centrality_raw"],
+            "rater_id": peer.id,
+            "interaction_count": state["interaction_count"]
+        })
 
+    return {
+        "last_trust": device.trust_score,
+        "rated_id": device.id,
+        "rated_reputation": get_reputation_level(device),
+        "is_flagged": bool(device.is_flagged),
+        "suspicious_count": device.suspicious_count or 0,
+        "steps": steps
+    }, included
+
+def _apply_trust_result(session: Session, device: Device, interactions: list, steps: list, eval_duration: float):
+    # interactions: [(peer, success, state?), ...] dan steps: hasil trust engine per interaksi
+    # (berurutan); device mendapat hasil step terakhir, history mencatat setiap step
+    result = steps[-1]
+    device.trust_score = result["updated_trust"]
+    device.is_blacklisted = result["blacklisted"]
+
+    # blacklist event
+    if result["blacklisted"]:
+        device.blacklisted_at = datetime.utcnow() 
+        detection_time = (device.blacklisted_at - device.created_at).total_seconds()
+        logger.warning(f"BLACKLIST: Device {device.id} blacklisted after evaluation {eval_duration:.3f}s with detection time: {detection_time:.3f} after joined")
+    else:
+        logger.info(f"SAFE: Device {device.id} passed evaluation (duration {eval_duration:.3f}s)")
+
+    # menyimpan history, satu baris per interaksi seperti update satu per satu;
+    # timestamp dibuat naik agar urutan step (dan last_trust di rollup) tetap jelas
+    coordinator_id = get_coordinator_id(session)
+    now = datetime.utcnow()
+    for k, ((peer, success, *state), step) in enumerate(zip(interactions, steps)):
+        connection_count = state[0]["interaction_count"] if state and state[0] else device.connection_count
         session.add(TrustHistory(
             device_id=device.id,
-            trust_score=result["updated_trust"],
-            connection_count=device.connection_count,
+            timestamp=now + timedelta(microseconds=k),
+            trust_score=step["updated_trust"],
+            connection_count=connection_count,
             last_connected_device_id=peer.id,
             notes=f"Connection {'success' if success else 'failed'} with {peer.id}",
+            event_type="trust_updated",
             coordinator_id=coordinator_id,
-            direct_trust=result.get("direct_trust"),
-            indirect_trust=result.get("indirect_trust"),
-            centrality_score=result.get("centrality_score")
+            direct_trust=step.get("direct_trust"),
+            indirect_trust=step.get("indirect_trust"),
+            centrality_score=step.get("centrality_score")
         ))
 
-    except Exception as e:
-        logger.error(f"Error contacting trust service: {e}")
-
+def _enforce_trust_threshold(session: Session, device: Device):
     # blacklist jika skor di bawah ambang batas dan belum di-blacklist
     if device.trust_score < TRUST_THRESHOLD and not device.is_blacklisted:
         blacklist_reason = f"Trust score ({device.trust_score:.3f}) fell below threshold ({TRUST_THRESHOLD})."
@@ -178,6 +239,82 @@ def update_trust_score(session: Session, device: Device, peer: Device, success:
         logger.warning(f"Coordinator {device.id} unfit, will be replaced")
         ensure_valid_coordinator(session)
 
+def update_trust_score(session: Session, device: Device, peer: Device, success: bool):
+    payload = _prepare_trust_update(session, device, peer, success)
+    if payload is None:
+        return
+
+    # mengirim ke trust engine (trust-service atau in-process)
+    try:
+        start_eval = datetime.utcnow()
+        result = get_trust_engine().calculate_trust(payload)
+
+        eval_duration = (datetime.utcnow() - start_eval).total_seconds()
+        _apply_trust_result(session, device, [(peer, success)], [result], eval_duration)
+
+    except Exception as e:
+        logger.error(f"Error contacting trust service: {e}")
+
+    _enforce_trust_threshold(session, device)
+
+def update_trust_scores(session: Session, updates):
+    # versi batch dari update_trust_score untuk (device, peer, success, state) yang terdampak,
+    # state dari interaction_state (None -> diambil dari kondisi device sekarang).
+    # Interaksi satu device digabung dan dievaluasi berurutan oleh trust engine
+    # (sama dengan update satu per satu), semuanya dalam satu request.
+    interactions_by_device = {}
+    for device, peer, success, state in updates:
+        interactions_by_device.setdefault(device.id, (device, []))[1].append((peer, success, state))
+
+    pending = []
+    for device, interactions in interactions_by_device.values():
+        payload, included = _prepare_trust_sequence(session, device, interactions)
+        if payload is not None:
+            pending.append((device, included, payload))
+
+    if not pending:
+        return
+
+    results = None
+    try:
+        start_eval = datetime.utcnow()
+        results = get_trust_engine().calculate_trust_sequences([payload for *_, payload in pending])
+        eval_duration = (datetime.utcnow() - start_eval).total_seconds()
+    except Exception as e:
+        logger.error(f"Error contacting trust service: {e}")
+
+    for i, (device, included, _) in enumerate(pending):
+        if results is not None:
+            # sama seperti update satu per satu: device yang ter-blacklist oleh hasil sebelumnya
+            # di batch ini dilewati, dan interaksi dengan peer yang ter-blacklist (beserta
+            # interaksi setelahnya) tidak dipakai
+            steps = results[i]["steps"]
+            applied = 0
+            while applied < len(steps) and not included[applied][0].is_blacklisted:
+                applied += 1
+
+            if device.is_blacklisted or applied == 0:
+                logger.debug(f"SKIP_UPDATE: {device.id} or its peers blacklisted earlier in batch")
+                continue
+            try:
+                _apply_trust_result(session, device, included[:applied], steps[:applied], eval_duration)
+            except Exception as e:
+                logger.error(f"Error applying trust result for {device.id}: {e}")
+
+        _enforce_trust_threshold(session, device)
+
+def register_inbound_peer(session: Session, device: Device, peer_id: str) -> bool:
+    # mencatat peer_id sebagai source unik untuk device, O(1) lewat primary key
+    if session.get(InboundPeer, (device.id, peer_id)) is not None:
+        return False
+
+    inbound = InboundPeer(device_id=device.id, peer_id=peer_id)
+    session.add(inbound)
+    # di-flush langsung agar koneksi berikutnya dalam batch yang sama melihat peer ini
+    session.flush([inbound])
+    device.inbound_peer_count = (device.inbound_peer_count or 0) + 1
+    return True
+
 def leave_device(session: Session, device_id: str):
     device = session.query(Device).filter(Device.id == device_id).first()
     if not device:
@@ -196,16 +333,18 @@ def leave_device(session: Session, device_id: str):
         connection_count=device.connection_count,
         last_connected_device_id=None,
         notes="Device left the system",
+        event_type="device_left",
         coordinator_id=None
     ))
 
     session.commit()
 
 def check_device_history(session: Session, device_id: str) -> dict:
-    is_blacklisted_before = session.query(TrustHistory)\
-        .filter(TrustHistory.device_id == device_id)\
-        .filter(TrustHistory.notes.like('%blacklist%'))\
-        .first()
+    # index (device_id, event_type), tanpa memuat baris
+    is_blacklisted_before = session.execute(select(exists().where(
+        TrustHistory.device_id == device_id,
+        TrustHistory.event_type == "blacklisted"
+    ))).scalar()
     
     if is_blacklisted_before:
         return {
@@ -263,6 +402,7 @@ def add_device(session: Session, device_data):
             connection_count=device.connection_count,
             last_connected_device_id=None,
             notes=f"Device rejoined - {history_check['status']}",
+            event_type="device_rejoined",
             coordinator_id=None
         ))
 
@@ -270,8 +410,7 @@ def add_device(session: Session, device_data):
         return device
 
     # device baru
-    res = requests.post(f"{TRUST_SERVICE_URL}/trust/initial", json=device_data.model_dump())
-    trust_result = res.json()
+    trust_result = get_trust_engine().initial_trust(device_data.model_dump())
     
     initial_trust = trust_result["trust_score"]
     computing_power = trust_result.get("computing_power", 0.5)  # default jika tidak ada
@@ -303,18 +442,19 @@ def add_device(session: Session, device_data):
         connection_count=0,
         last_connected_device_id=None,
         notes="Device registered",
+        event_type="device_registered",
         coordinator_id=None
     ))
     session.commit()
 
     ensure_valid_coordinator(session)
+    session.commit()
 
     return new_device
 
-def add_peer_rating(session: Session, rater_id: str, rated_id: str, score: float, reason: str = None, update_trust: bool = False):
-    # validasi devices
-    rater = session.get(Device, rater_id)
-    rated = session.get(Device, rated_id)
+def _apply_peer_rating(session: Session, rater_id: str, rated_id: str, rater: Device, rated: Device, score: float, reason: str = None):
+    # validasi, deteksi rating tidak jujur dan insert rating tanpa commit;
+    # ValueError dilempar sebelum ada perubahan pada session
     if not rater or not rated:
         raise ValueError("Device not found")
     
@@ -357,17 +497,7 @@ def add_peer_rating(session: Session, rater_id: str, rated_id: str, score: float
         
         old_trust_score = rater.trust_score
         
-        rater.suspicious_count += 1
-        rater.last_suspicious_activity = datetime.utcnow()
-
-        import json
-        reasons_list = json.loads(rater.suspicious_reasons or "[]") 
-        reasons_list.append({ 
-            "type": dishonest_type,
-            "timestamp": datetime.utcnow().isoformat(),
-            "details": log_reason
-        })
-        rater.suspicious_reasons = json.dumps(reasons_list[-10:]) 
+        add_suspicious_event(session, rater, dishonest_type, log_reason)
 
         if rater.suspicious_count >= 3:
             rater.is_flagged = True
@@ -381,27 +511,142 @@ def add_peer_rating(session: Session, rater_id: str, rated_id: str, score: float
             device_id=rater.id,
             trust_score=rater.trust_score,
             connection_count=rater.connection_count,
-            notes=f"Dishonest rating penalty (suspicious count: {rater.suspicious_count}). Reason: {log_reason}"
+            notes=f"Dishonest rating penalty (suspicious count: {rater.suspicious_count}). Reason: {log_reason}",
+            event_type="dishonest_rating"
         )
         session.add(penalty_log)
 
     rating = PeerRating(
-        rater_device_id=rater_id, rated_device_id=rated_id, score=score, comment=reason
+        rater_device_id=rater_id, rated_device_id=rated_id, score=score, comment=reason,
+        connection_id=last_interaction.id if last_interaction else None
     )
     session.add(rating)
+    return rating
+
+def add_suspicious_event(session: Session, device: Device, event_type: str, details: str):
+    # satu baris baru di suspicious_events, tanpa membaca event sebelumnya
+    now = datetime.utcnow()
+    device.suspicious_count += 1
+    device.last_suspicious_activity = now
+    session.add(SuspiciousEvent(device_id=device.id, event_type=event_type, timestamp=now, details=details))
+
+def get_suspicious_events(session: Session, device_id: str, limit: int = 10) -> list:
+    # event terbaru lebih dulu (index device_id, timestamp)
+    return session.execute(
+        select(SuspiciousEvent)
+        .where(SuspiciousEvent.device_id == device_id)
+        .order_by(SuspiciousEvent.timestamp.desc(), SuspiciousEvent.id.desc())
+        .limit(limit)
+    ).scalars().all()
+
+def _epoch_seconds(session: Session, column):
+    if session.get_bind().dialect.name == "postgresql":
+        return cast(func.extract("epoch", column), Integer)
+    return cast(func.strftime("%s", column), Integer)
+
+def count_suspicious_events(session: Session, since: datetime, until: datetime = None, bucket_seconds: int = None) -> list:
+    """
+    Jumlah suspicious event per tipe sejak `since`, dihitung di database.
+    Dengan bucket_seconds hasilnya juga dikelompokkan per window waktu.
+    """
+    columns = [SuspiciousEvent.event_type]
+    if bucket_seconds:
+        columns.append((_epoch_seconds(session, SuspiciousEvent.timestamp) // bucket_seconds * bucket_seconds).label("bucket"))
+    stmt = select(*columns, func.count().label("count")).where(SuspiciousEvent.timestamp >= since)
+    if until is not None:
+        stmt = stmt.where(SuspiciousEvent.timestamp < until)
+    stmt = stmt.group_by(*columns).order_by(*columns)
+
+    results = []
+    for row in session.execute(stmt):
+        item = {"event_type": row.event_type, "count": row.count}
+        if bucket_seconds:
+            item["window_start"] = datetime.utcfromtimestamp(row.bucket)
+        results.append(item)
+    return results
+
+def add_peer_rating(session: Session, rater_id: str, rated_id: str, score: float, reason: str = None, update_trust: bool = False):
+    # validasi devices (dengan row lock, rater bisa mendapat penalti)
+    locked = lock_devices(session, [rater_id, rated_id])
+    rating = _apply_peer_rating(session, rater_id, rated_id, locked.get(rater_id), locked.get(rated_id), score, reason)
     session.commit()
     return rating
 
+def add_peer_ratings(session: Session, ratings) -> list:
+    # versi batch dari add_peer_rating: satu lock untuk semua device, satu commit untuk semua rating
+    locked = lock_devices(session, [r["rater_id"] for r in ratings] + [r["rated_id"] for r in ratings])
+
+    results = []
+    for index, r in enumerate(ratings):
+        try:
+            rating = _apply_peer_rating(
+                session, r["rater_id"], r["rated_id"], locked.get(r["rater_id"]), locked.get(r["rated_id"]),
+                r["score"], r.get("reason")
+            )
+            results.append({"index": index, "status": "recorded", "rating": rating})
+        except ValueError as e:
+            results.append({"index": index, "status": "rejected", "reason": str(e)})
+
+    # id dibaca setelah flush, sebelum commit meng-expire objek
+    session.flush()
+    for result in results:
+        rating = result.pop("rating", None)
+        if rating is not None:
+            result["rating_id"] = rating.id
+    session.commit()
+    return results
+
+# kolom yang bisa dipilih di /devices/ (suspicious_reasons lama tidak ikut)
+DEVICE_LIST_FIELDS = tuple(c.name for c in Device.__table__.columns if c.name != "suspicious_reasons")
+
+def list_devices(session: Session, fields=None, limit: int = None, cursor: str = None):
+    """
+    Projection kolom device (tanpa relasi), urut berdasarkan id. Mengembalikan
+    (devices, next_cursor); next_cursor adalah id terakhir jika masih ada halaman berikutnya.
+    """
+    fields = list(fields or DEVICE_LIST_FIELDS)
+    if "id" not in fields:
+        fields.insert(0, "id")
+    columns = [Device.__table__.c[name] for name in fields]
+
+    stmt = select(*columns).order_by(Device.id)
+    if cursor:
+        stmt = stmt.where(Device.id > cursor)
+    if limit:
+        stmt = stmt.limit(limit + 1)
+    rows = session.execute(stmt).mappings().all()
+
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1]["id"]
+    return [dict(row) for row in rows], next_cursor
+
+def devices_version(session: Session) -> tuple:
+    # (jumlah device, perubahan terakhir); berubah jika ada device yang ditambah atau diubah
+    count, last_update = session.execute(select(func.count(Device.id), func.max(Device.updated_at))).one()
+    return count, last_update
+
+def device_states(session: Session, device_ids) -> dict:
+    # device yang sudah ada di session dipakai langsung (bisa berisi perubahan yang belum di-commit),
+    # sisanya dari device_cache; miss dimuat dengan satu query
+    states, missing = {}, []
+    for device_id in dict.fromkeys(device_ids):
+        device = session.identity_map.get(identity_key(Device, device_id))
+        if device is not None:
+            states[device_id] = device
+        else:
+            missing.append(device_id)
+    if missing:
+        states.update(device_cache.get_many(session, missing))
+    return states
+
 def get_device_reputation_info(session: Session, device_id: str) -> dict:
-    device = session.get(Device, device_id)
+    # dari device_cache, tanpa query selama entri masih berlaku
+    device = device_cache.get(session, device_id)
     if not device:
         return {"exists": False}
     
-    # parse suspicious reasons untuk analisis
-    import json
-    reasons = json.loads(device.suspicious_reasons or "[]")
-    recent_reasons = [r for r in reasons if r.get("type")]
-    
     return {
         "exists": True,
         "trust_score": device.trust_score,
@@ -410,50 +655,27 @@ def get_device_reputation_info(session: Session, device_id: str) -> dict:
         "suspicious_count": device.suspicious_count,
         "reputation_level": get_reputation_level(device),
         "last_suspicious_activity": device.last_suspicious_activity,
-        "recent_suspicious_types": [r["type"] for r in recent_reasons[-3:]]  
+        "recent_suspicious_types": list(device.suspicious_types)
     }
 
-def get_reputation_level(device: Device) -> str:
-    if device.is_blacklisted:
-        return "BLACKLISTED"
-    elif device.is_flagged:
-        if device.suspicious_count >= 5:
-            return "VERY_SUSPICIOUS"
-        else:
-            return "SUSPICIOUS"
-    elif device.trust_score >= 0.8:
-        return "EXCELLENT"
-    elif device.trust_score >= 0.6:
-        return "GOOD"
-    elif device.trust_score >= 0.4:
-        return "AVERAGE"
-    else:
-        return "POOR"
+def get_reputation_level(device) -> str:
+    # device: Device atau DeviceState dari device_cache; aturan level ada di trust-service/logic.py
+    return load_trust_logic().get_reputation_level(
+        device.trust_score, device.is_blacklisted, device.is_flagged, device.suspicious_count
+    )
     
 def handle_flooding_check(session: Session, source_id: str, source: Device):
     if source.is_blacklisted:
         logger.debug(f"SKIP_FLOOD_CHECK: Device {source.id} is blacklisted")
         return
 
-    recent_conn = session.query(Connection).filter(
-        Connection.source_device_id == source_id,
-        Connection.timestamp >= datetime.utcnow() - timedelta(seconds=10)
-    ).count()
+    # jumlah koneksi dari source dalam window terakhir (sliding window, bukan COUNT(*) ke tabel)
+    recent_conn = get_flood_counter().count(source_id, session)
 
     sec_eval = evaluate_security(source_id, recent_conn, session)
 
     if sec_eval["penalty"] > 0:
-        source.suspicious_count += 1
-        source.last_suspicious_activity = datetime.utcnow()
-
-        import json
-        reason = json.loads(source.suspicious_reasons or "[]")
-        reason.append({
-            "type": "flooding",
-            "timestamp": datetime.utcnow().isoformat(),
-            "details": f"Recent connections: {recent_conn}"
-        })
-        source.suspicious_reasons = json.dumps(reason[-10:])
+        add_suspicious_event(session, source, "flooding", f"Recent connections: {recent_conn}")
 
         if source.suspicious_count >= 2:
             source.is_flagged = True
@@ -465,18 +687,25 @@ def handle_flooding_check(session: Session, source_id: str, source: Device):
             device_id=source.id,
             trust_score=source.trust_score,
             connection_count=source.connection_count,
-            notes=f"Flooding detected (suspicious count: {source.suspicious_count}). Recent: {recent_conn}"
+            notes=f"Flooding detected (suspicious count: {source.suspicious_count}). Recent: {recent_conn}",
+            event_type="flooding_detected"
         )
         session.add(flood_log)
         logger.warning(f"FLOODING: Device {source.id} - {recent_conn} connections in 1min (penalty: {sec_eval['penalty']}, total suspicious: {source.suspicious_count})")
 
 def record_connection(session: Session, connections, update_trust: bool = True):
-    if isinstance(connections, dict):
+    # dict -> satu koneksi; list -> batch dengan hasil per item
+    single = isinstance(connections, dict)
+    if single:
         connections = [connections]
     
-    affected_devices = set()
+    interactions = []
+    results = []
+
+    # row lock untuk semua device yang terlibat sebelum statistik dan trust dihitung
+    lock_devices(session, [c["source_id"] for c in connections] + [c["target_id"] for c in connections])
     
-    for conn_data in connections:
+    for index, conn_data in enumerate(connections):
         source_id = conn_data["source_id"]
         target_id = conn_data["target_id"] 
         status = conn_data["status"]
@@ -487,9 +716,11 @@ def record_connection(session: Session, connections, update_trust: bool = True):
         
         if not source:
             logger.error(f"UNREGISTERED ACCESS: {source_id} attempted to connect")
+            results.append({"index": index, "status": "rejected", "reason": f"Device {source_id} not found"})
             continue
         if not target:
             logger.error(f"UNREGISTERED ACCESS: {target_id} not found")
+            results.append({"index": index, "status": "rejected", "reason": f"Device {target_id} not found"})
             continue
 
         if source.is_blacklisted or target.is_blacklisted:
@@ -497,6 +728,8 @@ def record_connection(session: Session, connections, update_trust: bool = True):
                 f"BLACKLIST_VIOLATION: Connection between {source_id} (blacklisted: {source.is_blacklisted}) "
                 f"and {target_id} (blacklisted: {target.is_blacklisted}) was blocked."
             )
+            blocked_id = source_id if source.is_blacklisted else target_id
+            results.append({"index": index, "status": "rejected", "reason": f"Device {blocked_id} is blacklisted"})
             continue 
 
         handle_flooding_check(session, source_id, source)
@@ -508,6 +741,10 @@ def record_connection(session: Session, connections, update_trust: bool = True):
             connection_type=connection_type
         )
         session.add(conn)
+        get_flood_counter().record(source_id, session)
+
+        if status:
+            register_inbound_peer(session, target, source_id)
 
         # update stats untuk non blacklisted
         source.is_active = True
@@ -523,85 +760,111 @@ def record_connection(session: Session, connections, update_trust: bool = True):
         source.connection_count = source.successful_connections + source.failed_connections
         target.connection_count = target.successful_connections + target.failed_connections
 
-        affected_devices.add((source, target, status))
+        interactions.append((
+            source, target, status,
+            _interaction_state(session, source, target, status),
+            _interaction_state(session, target, source, status)
+        ))
+        results.append({"index": index, "status": "recorded", "connection": conn})
 
-    # update trust untuk semua affected devices
+    # update trust untuk semua device yang terlibat dalam satu panggilan batch;
+    # setiap interaksi dihitung untuk kedua sisi, urutan interaksi dipertahankan
     if update_trust:
-        processed = set()
-        for source, target, status in affected_devices:
+        updates = []
+        for source, target, status, source_state, target_state in interactions:
             if source.is_blacklisted or target.is_blacklisted:
                 continue
+            updates.append((source, target, status, source_state))
+            updates.append((target, source, status, target_state))
 
-            if source.id not in processed:
-                update_trust_score(session, source, target, status)
-                processed.add(source.id)
-            if target.id not in processed:
-                update_trust_score(session, target, source, status)
-                processed.add(target.id)
+        update_trust_scores(session, updates)
 
+    # id dibaca setelah flush, sebelum commit meng-expire objek
+    session.flush()
+    for result in results:
+        conn = result.pop("connection", None)
+        if conn is not None:
+            result["connection_id"] = conn.id
     session.commit()
     
-    if len(connections) == 1:
+    if single:
         return {"message": "Connection recorded and trust updated"}
     else:
-        return {"message": f"{len(connections)} connections processed"}
+        return {"message": f"{len(connections)} connections processed", "results": results}
    
+def _load_candidate(session: Session, device_id: str):
+    return lock_devices(session, [device_id]).get(device_id)
+
 def select_coordinator(session: Session, old_coordinator_id: str = None):
-    # simpan koordinator sebelum reset
-    current_coordinator_obj = session.query(Device).filter_by(is_coordinator=True).first()
-    old_coord_id = current_coordinator_obj.id if current_coordinator_obj else old_coordinator_id
-    
-    # reset 
-    session.query(Device).update({Device.is_coordinator: False})
-    session.commit()
+    # hanya flush: commit dilakukan pemanggil (route atau write queue) bersama perubahan lain
+    # di transaksi yang sama, sehingga row lock dari lock_devices tetap dipegang sampai akhir
+    lock_coordinator_election(session)
+    # perubahan device di session ini ikut masuk ranking lewat hook after_flush
+    session.flush()
+
+    # simpan koordinator sebelum pemilihan
+    current_id = session.execute(select(Device.id).where(Device.is_coordinator == True).limit(1)).scalar()
+    old_coord_id = current_id or old_coordinator_id
 
     logger.info("Selecting new coordinator...")
 
-    # hanya internal devices - RSU internal > Computer internal berdasarkan trust
-    internal_coordinator = session.query(Device).filter(
-        Device.is_blacklisted == False,
-        Device.ownership_type == "internal",
-        Device.device_type.in_(["RSU", "Computer"]),  
-        Device.trust_score >= TRUST_THRESHOLD,
-        Device.is_active == True
-    ).order_by(
-    
-        case((Device.device_type == "RSU", 0), else_=1),
-        Device.trust_score.desc()
-    ).first()
+    # kandidat teratas dari ranking (RSU internal > Computer internal berdasarkan trust)
+    internal_coordinator = coordinator_ranking.best(session, _load_candidate)
+
+    if internal_coordinator and internal_coordinator.id == current_id:
+        # koordinator saat ini masih yang terbaik
+        return internal_coordinator
+
+    # hanya dua baris yang diubah: koordinator lama dilepas dan di-flush lebih dulu (unique index)
+    if current_id:
+        session.get(Device, current_id).is_coordinator = False
+        session.flush()
 
     if internal_coordinator:
-        # jika ditemukan koordinator baru yang berbeda dari yang lama
-        if internal_coordinator.id != old_coord_id:
-            internal_coordinator.is_coordinator = True
-            session.commit()
-            logger.info(f"Internal coordinator selected: {internal_coordinator.id} ({internal_coordinator.device_type})")
-         
-            log_note = f"Elected as new community coordinator."
-            if old_coord_id:
-                log_note += f" Replacing former coordinator {old_coord_id}."
-            
-            log_entry = TrustHistory(
-                device_id=internal_coordinator.id,
-                trust_score=internal_coordinator.trust_score,
-                connection_count=internal_coordinator.connection_count,
-                notes=log_note,
-                coordinator_id=old_coord_id 
-            )
-            session.add(log_entry)
-            session.commit()
+        internal_coordinator.is_coordinator = True
+        logger.info(f"Internal coordinator selected: {internal_coordinator.id} ({internal_coordinator.device_type})")
+     
+        log_note = f"Elected as new community coordinator."
+        if old_coord_id:
+            log_note += f" Replacing former coordinator {old_coord_id}."
+        
+        log_entry = TrustHistory(
+            device_id=internal_coordinator.id,
+            trust_score=internal_coordinator.trust_score,
+            connection_count=internal_coordinator.connection_count,
+            notes=log_note,
+            event_type="coordinator_elected",
+            coordinator_id=old_coord_id 
+        )
+        session.add(log_entry)
+        _publish_coordinator(session, internal_coordinator.id)
+        session.flush()
         return internal_coordinator
     
     logger.warning("No eligible internal devices found for coordinator")
+    # epoch hanya dinaikkan jika sebelumnya ada koordinator; tanpa perubahan slot worker tetap valid
     if old_coord_id:
         log_entry = TrustHistory(
             notes=f"Failed to elect new coordinator. System is now without a coordinator (was {old_coord_id}).",
+            event_type="coordinator_election_failed",
             coordinator_id=old_coord_id
         )
         session.add(log_entry)
-        session.commit()
+        _publish_coordinator(session, None)
+        session.flush()
     return None
 
+def _publish_coordinator(session: Session, coordinator_id: str):
+    # epoch dinaikkan dalam transaksi pemilihan; slot di proses ini diperbarui setelah commit,
+    # worker lain melihat epoch baru saat polling berikutnya
+    state = session.get(SystemState, COORDINATOR_EPOCH_KEY)
+    if state is None:
+        state = SystemState(key=COORDINATOR_EPOCH_KEY, value=0)
+        session.add(state)
+    state.value = (state.value or 0) + 1
+    session.info["pending_coordinator"] = (coordinator_id, state.value)
+    stage_event(session, "coordinator_elected", {"device_id": coordinator_id, "epoch": state.value})
+
 def blacklist_device(session: Session, device: Device, reason: str):
     if device.is_blacklisted:
         return 
@@ -618,6 +881,7 @@ def blacklist_device(session: Session, device: Device, reason: str):
         trust_score=device.trust_score,
         connection_count=device.connection_count,
         notes=f"Device blacklisted. Reason: {reason}",
+        event_type="blacklisted",
         coordinator_id=None 
     )
     session.add(log_entry)
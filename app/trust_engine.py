@@ -0,0 +1,295 @@
+import asyncio
+import contextvars
+import importlib.util
+import logging
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# TRUST_ENGINE=http      -> setiap evaluasi dikirim ke trust-service (deployment terpisah)
+# TRUST_ENGINE=inprocess -> fungsi di trust-service/logic.py dipanggil langsung di proses backend
+TRUST_ENGINE = os.getenv("TRUST_ENGINE", "http").lower()
+TRUST_SERVICE_URL = os.getenv("TRUST_SERVICE_URL", "http://localhost:8001")
+TRUST_LOGIC_PATH = os.getenv(
+    "TRUST_LOGIC_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "trust-service", "logic.py")
+)
+
+# pengaturan koneksi ke trust-service
+TRUST_HTTP_POOL_SIZE = int(os.getenv("TRUST_HTTP_POOL_SIZE", "20"))
+TRUST_HTTP_CONNECT_TIMEOUT = float(os.getenv("TRUST_HTTP_CONNECT_TIMEOUT", "1.0"))
+TRUST_HTTP_READ_TIMEOUT = float(os.getenv("TRUST_HTTP_READ_TIMEOUT", "5.0"))
+TRUST_HTTP_RETRIES = int(os.getenv("TRUST_HTTP_RETRIES", "2"))
+TRUST_HTTP_BACKOFF = float(os.getenv("TRUST_HTTP_BACKOFF", "0.1"))
+TRUST_BREAKER_THRESHOLD = int(os.getenv("TRUST_BREAKER_THRESHOLD", "5"))
+TRUST_BREAKER_RESET_SECONDS = float(os.getenv("TRUST_BREAKER_RESET_SECONDS", "30"))
+# jika trust-service tidak bisa dihubungi, evaluasi dilakukan lokal dengan logic.py
+TRUST_HTTP_FALLBACK = os.getenv("TRUST_HTTP_FALLBACK", "true").lower() in ("1", "true", "yes")
+
+logger = logging.getLogger(__name__)
+
+_logic_module = None
+_engine = None
+_async_engine = None
+_engine_lock = threading.Lock()
+# engine yang dipakai di konteks saat ini (mis. route async memakai engine httpx)
+_current_engine = contextvars.ContextVar("trust_engine", default=None)
+
+class TrustEngineUnavailable(RuntimeError):
+    pass
+
+def load_trust_logic():
+    # folder trust-service tidak bisa di-import sebagai package (ada tanda "-"), jadi dimuat dari path
+    global _logic_module
+    if _logic_module is None:
+        spec = importlib.util.spec_from_file_location("trust_logic", TRUST_LOGIC_PATH)
+        if spec is None:
+            raise ImportError(f"Trust logic not found at {TRUST_LOGIC_PATH}")
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _logic_module = module
+    return _logic_module
+
+class CircuitBreaker:
+    # closed -> open setelah `threshold` kegagalan berturut-turut; setelah `reset_seconds`
+    # satu request percobaan (half-open) diizinkan untuk menutup kembali circuit
+    def __init__(self, threshold: int = TRUST_BREAKER_THRESHOLD, reset_seconds: float = TRUST_BREAKER_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state != "half_open":
+                return self.state == "closed"
+            # hanya satu request percobaan per periode reset
+            self.opened_at = time.monotonic()
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.warning(f"Trust service circuit opened after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+
+class HttpTrustEngine:
+    name = "http"
+    transport_errors = (requests.exceptions.RequestException, ValueError)
+
+    def __init__(self, base_url: str = TRUST_SERVICE_URL, fallback=None):
+        self.base_url = base_url
+        self.timeout = (TRUST_HTTP_CONNECT_TIMEOUT, TRUST_HTTP_READ_TIMEOUT)
+        self.breaker = CircuitBreaker()
+        self.fallback = fallback
+        self.request_count = 0
+        self.failure_count = 0
+        self.fallback_count = 0
+        self._setup_transport()
+
+    def _setup_transport(self):
+        # satu session per proses: koneksi keep-alive dipakai ulang lewat pool urllib3
+        retry = Retry(
+            total=TRUST_HTTP_RETRIES,
+            backoff_factor=TRUST_HTTP_BACKOFF,
+            status_forcelist=(502, 503, 504),
+            # semua endpoint trust-service bebas efek samping, jadi POST aman diulang
+            allowed_methods=frozenset(["GET", "POST"]),
+            raise_on_status=False
+        )
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=TRUST_HTTP_POOL_SIZE, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+
+    def _post(self, path: str, payload, fallback_method: str):
+        if self.breaker.allow_request():
+            self.request_count += 1
+            try:
+                result = self._send(path, payload)
+                self.breaker.record_success()
+                return result
+            except self.transport_errors as e:
+                self.failure_count += 1
+                self.breaker.record_failure()
+                if self.fallback is None:
+                    raise TrustEngineUnavailable(f"Trust service call {path} failed: {e}") from e
+                logger.error(f"Trust service call {path} failed, using local evaluation: {e}")
+        elif self.fallback is None:
+            raise TrustEngineUnavailable(f"Trust service circuit is {self.breaker.state}")
+
+        self.fallback_count += 1
+        return getattr(self.fallback, fallback_method)(payload)
+
+    def _send(self, path: str, payload):
+        res = self.session.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout)
+        res.raise_for_status()
+        return res.json()
+
+    def initial_trust(self, payload: dict) -> dict:
+        return self._post("/trust/initial", payload, "initial_trust")
+
+    def calculate_trust(self, payload: dict) -> dict:
+        return self._post("/trust/calculate", payload, "calculate_trust")
+
+    def calculate_trust_sequences(self, payloads: list) -> list:
+        return self._post("/trust/calculate/sequence", payloads, "calculate_trust_sequences")
+
+    def evaluate_security(self, payload: dict) -> dict:
+        return self._post("/security/evaluate", payload, "evaluate_security")
+
+    def _pool_stats(self) -> list:
+        pools = []
+        pool_manager = self.adapter.poolmanager
+        for key in list(pool_manager.pools.keys()):
+            pool = pool_manager.pools.get(key)
+            if pool is None:
+                continue
+            pools.append({
+                "host": pool.host,
+                "port": pool.port,
+                "maxsize": pool.pool.maxsize if pool.pool is not None else None,
+                # queue urllib3 diisi None sebagai placeholder, hanya koneksi nyata yang dihitung
+                "idle_connections": sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool is not None else 0,
+                "connections_created": pool.num_connections,
+                "requests_sent": pool.num_requests
+            })
+        return pools
+
+    def stats(self) -> dict:
+        return {
+            "engine": self.name,
+            "base_url": self.base_url,
+            "timeout": {"connect": self.timeout[0], "read": self.timeout[1]},
+            "circuit_state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "requests": self.request_count,
+            "failures": self.failure_count,
+            "fallbacks": self.fallback_count,
+            "fallback_available": self.fallback is not None,
+            "pools": self._pool_stats()
+        }
+
+class InProcessTrustEngine:
+    name = "inprocess"
+
+    def __init__(self, logic=None):
+        self.logic = logic or load_trust_logic()
+
+    def initial_trust(self, payload: dict) -> dict:
+        return self.logic.evaluate_initial_trust(**payload)
+
+    def calculate_trust(self, payload: dict) -> dict:
+        return self.logic.evaluate_trust_update(**payload)
+
+    def calculate_trust_sequences(self, payloads: list) -> list:
+        return self.logic.evaluate_trust_sequences(payloads)
+
+    def evaluate_security(self, payload: dict) -> dict:
+        return self.logic.evaluate_security(**payload)
+
+    def stats(self) -> dict:
+        return {"engine": self.name, "logic_path": TRUST_LOGIC_PATH}
+
+class AsyncHttpTrustEngine(HttpTrustEngine):
+    # interface sama dengan HttpTrustEngine (sinkron), tetapi request dikirim lewat httpx.AsyncClient.
+    # Hanya dipanggil dari fungsi services yang dijalankan dengan AsyncSession.run_sync, sehingga
+    # await_only menyerahkan request ke event loop dan tidak ada thread yang menunggu.
+    name = "http_async"
+
+    def _setup_transport(self):
+        import httpx
+        self.transport_errors = (httpx.HTTPError, ValueError)
+        self.client = None
+        self._client_loop = None
+
+    def _get_client(self):
+        # AsyncClient terikat ke event loop tempat ia dibuat
+        import httpx
+        loop = asyncio.get_running_loop()
+        if self.client is None or self._client_loop is not loop:
+            self.client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(TRUST_HTTP_READ_TIMEOUT, connect=TRUST_HTTP_CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=TRUST_HTTP_POOL_SIZE, max_keepalive_connections=TRUST_HTTP_POOL_SIZE),
+                # httpx hanya mengulang kegagalan koneksi
+                transport=httpx.AsyncHTTPTransport(retries=TRUST_HTTP_RETRIES)
+            )
+            self._client_loop = loop
+        return self.client
+
+    def _send(self, path: str, payload):
+        from sqlalchemy.util import await_only
+        res = await_only(self._get_client().post(path, json=payload))
+        res.raise_for_status()
+        return res.json()
+
+    def _pool_stats(self) -> list:
+        return [{"host": self.base_url, "maxsize": TRUST_HTTP_POOL_SIZE}]
+
+def _local_fallback():
+    if not TRUST_HTTP_FALLBACK:
+        return None
+    try:
+        return InProcessTrustEngine()
+    except (ImportError, OSError) as e:
+        logger.warning(f"Local trust evaluation unavailable, no fallback for trust service: {e}")
+        return None
+
+def create_trust_engine(kind: str = TRUST_ENGINE):
+    if kind == "http":
+        return HttpTrustEngine(fallback=_local_fallback())
+    if kind == "inprocess":
+        return InProcessTrustEngine()
+    raise ValueError(f"Unknown TRUST_ENGINE '{kind}', expected 'http' or 'inprocess'")
+
+def get_trust_engine():
+    current = _current_engine.get()
+    if current is not None:
+        return current
+
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_trust_engine()
+    return _engine
+
+def get_async_trust_engine():
+    # mode inprocess tidak punya I/O, jadi engine yang sama dipakai juga di jalur async
+    if TRUST_ENGINE != "http":
+        return get_trust_engine()
+
+    global _async_engine
+    if _async_engine is None:
+        with _engine_lock:
+            if _async_engine is None:
+                _async_engine = AsyncHttpTrustEngine(fallback=_local_fallback())
+    return _async_engine
+
+def run_with_engine(engine, fn, *args, **kwargs):
+    # menjalankan fn dengan engine tertentu sebagai hasil get_trust_engine()
+    token = _current_engine.set(engine)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _current_engine.reset(token)
@@ -0,0 +1,132 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from sqlalchemy.orm import Session, sessionmaker
+from .database import engine
+
+# WRITE_QUEUE_ENABLED=true -> /connect dan /rate_peer/ dijalankan oleh satu thread penulis,
+# beberapa request digabung dalam satu commit (group commit)
+WRITE_QUEUE_ENABLED = os.getenv("WRITE_QUEUE_ENABLED", "false").lower() in ("1", "true", "yes")
+WRITE_QUEUE_MAX_BATCH = int(os.getenv("WRITE_QUEUE_MAX_BATCH", "64"))
+# waktu tunggu maksimum untuk mengumpulkan job tambahan sebelum commit
+WRITE_QUEUE_MAX_DELAY_MS = float(os.getenv("WRITE_QUEUE_MAX_DELAY_MS", "5"))
+
+logger = logging.getLogger(__name__)
+
+class GroupCommitSession(Session):
+    # di dalam group commit, session.commit() di fungsi services hanya flush;
+    # commit sebenarnya dilakukan SingleWriter setelah semua job dalam batch selesai
+    def commit(self):
+        if self.info.get("group_commit"):
+            self.flush()
+        else:
+            super().commit()
+
+class SingleWriter:
+    def __init__(self, bind=engine, max_batch: int = WRITE_QUEUE_MAX_BATCH, max_delay_ms: float = WRITE_QUEUE_MAX_DELAY_MS):
+        self.session_factory = sessionmaker(bind=bind, class_=GroupCommitSession, autoflush=False)
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self.batches = 0
+        self.jobs = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="single-writer", daemon=True)
+                    self._thread.start()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        # fn(session, *args, **kwargs) dijalankan di thread penulis
+        self._ensure_thread()
+        future = Future()
+        self._queue.put((fn, args, kwargs, future))
+        return future
+
+    def run(self, fn, *args, **kwargs):
+        return self.submit(fn, *args, **kwargs).result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._commit_batch(batch)
+
+    def _commit_batch(self, batch):
+        session = self.session_factory()
+        session.info["group_commit"] = True
+        outcomes = []
+        try:
+            for fn, args, kwargs, future in batch:
+                # savepoint per job: job yang gagal tidak membatalkan job lain di batch
+                savepoint = session.begin_nested()
+                pending_coordinator = session.info.get("pending_coordinator")
+                pending_events = len(session.info.get("pending_events", ()))
+                try:
+                    result = fn(session, *args, **kwargs)
+                    savepoint.commit()
+                    outcomes.append((future, result, None))
+                except Exception as e:
+                    savepoint.rollback()
+                    # pemilihan koordinator dan event dari job yang gagal ikut dibatalkan
+                    session.info["pending_coordinator"] = pending_coordinator
+                    del session.info.get("pending_events", [])[pending_events:]
+                    outcomes.append((future, None, e))
+
+            session.info["group_commit"] = False
+            session.commit()
+        except Exception as e:
+            logger.error(f"Group commit of {len(batch)} write(s) failed: {e}")
+            session.rollback()
+            outcomes = [(future, None, e) for _, _, _, future in batch]
+        finally:
+            session.close()
+
+        self.batches += 1
+        self.jobs += len(batch)
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": WRITE_QUEUE_ENABLED,
+            "pending": self._queue.qsize(),
+            "batches": self.batches,
+            "jobs": self.jobs,
+            "avg_batch_size": round(self.jobs / self.batches, 2) if self.batches else 0
+        }
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_single_writer() -> SingleWriter:
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = SingleWriter()
+    return _writer
+
+def execute_write(session: Session, fn, *args, **kwargs):
+    # tanpa write queue, fn dijalankan langsung dengan session request
+    if not WRITE_QUEUE_ENABLED:
+        return fn(session, *args, **kwargs)
+    return get_single_writer().run(fn, *args, **kwargs)
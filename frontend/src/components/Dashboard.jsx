@@ -10,19 +10,40 @@ export default function InsightDashboard() {
   const [selectedIds, setSelectedIds] = useState([]);
   const [trustHistory, setTrustHistory] = useState({});
   const [coordinator, setCoordinator] = useState(null);
-  const [suspicious, setSuspicious] = useState([]);
 
   useEffect(() => {
     fetchDevices();
     fetchCoordinator();
+
+    // perubahan dikirim server lewat /events, tanpa polling
+    const source = new EventSource("http://localhost:8000/events");
+    const patchDevice = (e) => {
+      const { device_id, trust_score } = JSON.parse(e.data);
+      setDevices(prev => prev.map(d => (d.id === device_id ? { ...d, trust_score } : d)));
+    };
+    source.addEventListener("trust_updated", patchDevice);
+    source.addEventListener("blacklisted", patchDevice);
+    source.addEventListener("device_joined", fetchDevices);
+    source.addEventListener("coordinator_elected", fetchCoordinator);
+    source.addEventListener("reset", () => {
+      fetchDevices();
+      fetchCoordinator();
+    });
+    return () => source.close();
   }, []);
 
   const fetchDevices = async () => {
-    const res = await fetch("http://localhost:8000/devices");
-    const data = await res.json();
+    // /devices/ dipaginasi, halaman berikutnya lewat header X-Next-Cursor
+    const data = [];
+    let cursor = null;
+    do {
+      const params = new URLSearchParams({ fields: "id,name,trust_score" });
+      if (cursor) params.set("cursor", cursor);
+      const res = await fetch(`http://localhost:8000/devices/?${params}`);
+      data.push(...(await res.json()));
+      cursor = res.headers.get("X-Next-Cursor");
+    } while (cursor);
     setDevices(data);
-    const bad = data.filter(d => d.trust_score < 0.3);
-    setSuspicious(bad);
   };
 
   const fetchCoordinator = async () => {
@@ -31,6 +52,7 @@ export default function InsightDashboard() {
     setCoordinator(data);
   };
 
+ const suspicious = devices.filter(d => d.trust_score < 0.3);
  const options = devices.map(d => ({ value: d.id, label: d.id }));
 
 const handleMultiChange = async (selectedOptions) => {
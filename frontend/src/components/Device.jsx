@@ -14,11 +14,36 @@ export default function DevicePage() {
 
   useEffect(() => {
     fetchDevices();
+
+    // perubahan device dikirim server lewat /events, tanpa polling
+    const source = new EventSource("http://localhost:8000/events");
+    const patchDevice = (changes) => (e) => {
+      const data = JSON.parse(e.data);
+      setDevices(prev => prev.map(d => (d.id === data.device_id ? { ...d, ...changes(data) } : d)));
+    };
+    source.addEventListener("trust_updated", patchDevice(data => ({ trust_score: data.trust_score })));
+    source.addEventListener("blacklisted", patchDevice(data => ({
+      trust_score: data.trust_score, is_blacklisted: true, is_flagged: true, is_active: false
+    })));
+    source.addEventListener("flagged", patchDevice(data => ({ is_flagged: true })));
+    source.addEventListener("device_joined", fetchDevices);
+    source.addEventListener("device_left", fetchDevices);
+    source.addEventListener("reset", fetchDevices);
+    return () => source.close();
   }, []);
 
   const fetchDevices = async () => {
-    const res = await fetch("http://localhost:8000/devices");
-    const data = await res.json();
+    // /devices/ dipaginasi, halaman berikutnya lewat header X-Next-Cursor
+    const data = [];
+    let cursor = null;
+    do {
+      const url = cursor
+        ? `http://localhost:8000/devices/?cursor=${encodeURIComponent(cursor)}`
+        : "http://localhost:8000/devices/";
+      const res = await fetch(url);
+      data.push(...(await res.json()));
+      cursor = res.headers.get("X-Next-Cursor");
+    } while (cursor);
     setDevices(data);
   };
 
@@ -1,21 +1,94 @@
-import React, { useEffect, useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
+
+const PAGE_SIZE = 100;
 
 export default function LogActivityPage() {
   const [logs, setLogs] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [deviceId, setDeviceId] = useState("");
+  const [activityType, setActivityType] = useState("");
+  const [loading, setLoading] = useState(false);
+
+  useEffect(() => {
+    fetchLogs(null);
+  }, [activityType]);
 
+  // ada event di /events -> hanya log yang lebih baru dari baris teratas yang dimuat;
+  // satu koneksi selama halaman terbuka, fungsi terbaru dibaca lewat ref
+  const refreshRef = useRef({});
   useEffect(() => {
-    fetchLogs();
+    const source = new EventSource("http://localhost:8000/events");
+    let timer = null;
+    const schedule = () => {
+      clearTimeout(timer);
+      timer = setTimeout(() => refreshRef.current.fetchNewer(), 1000);
+    };
+    ["trust_updated", "blacklisted", "flagged", "device_joined", "device_left", "coordinator_elected"]
+      .forEach(type => source.addEventListener(type, schedule));
+    source.addEventListener("reset", () => refreshRef.current.fetchLogs(null));
+    return () => {
+      clearTimeout(timer);
+      source.close();
+    };
   }, []);
 
-  const fetchLogs = async () => {
-    const res = await fetch("http://localhost:8000/log_activity");
+  // cursor null -> halaman pertama, selain itu halaman berikutnya ditambahkan ke daftar
+  const fetchLogs = async (cursor) => {
+    const params = new URLSearchParams({ limit: PAGE_SIZE });
+    if (cursor) params.set("cursor", cursor);
+    if (deviceId) params.set("device_id", deviceId);
+    if (activityType) params.set("activity_type", activityType);
+
+    setLoading(true);
+    try {
+      const res = await fetch(`http://localhost:8000/log_activity?${params}`);
+      const data = await res.json();
+      setLogs((prev) => (cursor ? [...prev, ...data] : data));
+      setNextCursor(res.headers.get("X-Next-Cursor"));
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  const logKey = (log) => `${log.timestamp}|${log.device_id}|${log.description}`;
+
+  const fetchNewer = async () => {
+    if (logs.length === 0) return fetchLogs(null);
+    const params = new URLSearchParams({ limit: PAGE_SIZE, since: logs[0].timestamp });
+    if (deviceId) params.set("device_id", deviceId);
+    if (activityType) params.set("activity_type", activityType);
+
+    const res = await fetch(`http://localhost:8000/log_activity?${params}`);
     const data = await res.json();
-    setLogs(data);
+    setLogs((prev) => {
+      const seen = new Set(prev.map(logKey));
+      return [...data.filter(log => !seen.has(logKey(log))), ...prev];
+    });
+  };
+
+  refreshRef.current = { fetchLogs, fetchNewer };
+
+  const applyFilter = (e) => {
+    e.preventDefault();
+    fetchLogs(null);
   };
 
   return (
     <div className="container">
       <h1 className="text-xl">Log Aktivitas Perangkat</h1>
+      <form className="card" onSubmit={applyFilter}>
+        <input
+          placeholder="Device ID"
+          value={deviceId}
+          onChange={(e) => setDeviceId(e.target.value)}
+        />
+        <select value={activityType} onChange={(e) => setActivityType(e.target.value)}>
+          <option value="">Semua aktivitas</option>
+          <option value="normal">normal</option>
+          <option value="malicious">malicious</option>
+        </select>
+        <button type="submit">Filter</button>
+      </form>
       <div className="card">
         <table>
           <thead>
@@ -39,6 +112,11 @@ export default function LogActivityPage() {
             ))}
           </tbody>
         </table>
+        {nextCursor && (
+          <button onClick={() => fetchLogs(nextCursor)} disabled={loading}>
+            {loading ? "Memuat..." : "Muat lebih banyak"}
+          </button>
+        )}
       </div>
     </div>
   );
@@ -0,0 +1,349 @@
+# python load_generator.py --devices 20000 --rps 500 --duration 60 [--attack-mix badmouth=2,flood=1,hijack=1,collusion=1]
+#
+# Beban open-loop ke backend lokal (BASE_URL): interaksi datang sebagai proses Poisson dengan
+# laju --rps, tidak menunggu request sebelumnya selesai. Perilaku device sama seperti skenario:
+# device normal berinteraksi dan memberi rating berdasarkan reputasi (skenario 1), device jahat
+# menjalankan serangan badmouthing (2), flooding (3), serangan ke koordinator dan kolusi (4, 5).
+# Latensi dicatat per endpoint dalam histogram logaritmik.
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import httpx
+from test_utils import BASE_URL, TOTAL_DEVICES, MALICIOUS_PERCENT, device_payload, smart_score
+
+DEFAULT_ATTACK_MIX = "badmouth=2,flood=1,hijack=1,collusion=1"
+# jumlah koneksi per serangan flooding (skenario 3 mengirim 30 per penyerang)
+FLOOD_BURST = 30
+# percobaan registrasi per device jika server gagal (mis. SQLite "database is locked":
+# /device tidak lewat write queue sehingga registrasi paralel saling berebut lock)
+REGISTER_ATTEMPTS = 5
+
+class LatencyHistogram:
+    # bucket logaritmik (10 per dekade) dari 0.1 ms sampai 100 s: memori tetap berapapun jumlah request
+    def __init__(self, min_ms: float = 0.1, max_ms: float = 100000, per_decade: int = 10):
+        self.min_ms = min_ms
+        self.per_decade = per_decade
+        self.counts = [0] * (int(math.log10(max_ms / min_ms) * per_decade) + 2)
+        self.count = 0
+        self.errors = 0
+        # status HTTP -> jumlah; "error" untuk timeout/koneksi gagal
+        self.statuses = {}
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def _index(self, ms: float) -> int:
+        if ms <= self.min_ms:
+            return 0
+        return min(len(self.counts) - 1, int(math.log10(ms / self.min_ms) * self.per_decade) + 1)
+
+    def upper_bound(self, index: int) -> float:
+        return self.min_ms * 10 ** (index / self.per_decade)
+
+    def record(self, ms: float, status):
+        self.counts[self._index(ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if status == "error" or status >= 500:
+            self.errors += 1
+
+    def percentile(self, p: float) -> float:
+        # batas atas bucket tempat persentil berada (error relatif maksimum ~26%)
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * p / 100)
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(self.upper_bound(index), self.max_ms)
+        return self.max_ms
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "statuses": {str(status): n for status, n in self.statuses.items()},
+            "mean_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50), 2),
+            "p90_ms": round(self.percentile(90), 2),
+            "p99_ms": round(self.percentile(99), 2),
+            "max_ms": round(self.max_ms, 2),
+            "buckets": {f"{self.upper_bound(i):.3g}": n for i, n in enumerate(self.counts) if n},
+        }
+
+class LoadGenerator:
+    def __init__(self, client: httpx.AsyncClient, rng: random.Random, attack_mix: dict, max_in_flight: int):
+        self.client = client
+        self.rng = rng
+        self.attack_mix = attack_mix
+        self.max_in_flight = max_in_flight
+        self.histograms = {}
+        self.in_flight = 0
+        self.started = 0
+        self.dropped = 0
+        self.actions = {}
+        self.device_ids = []
+        self.malicious_ids = []
+        self.normal_ids = []
+        self.malicious_set = set()
+
+    # --- request ---
+
+    async def request(self, method: str, endpoint: str, path: str, **kwargs):
+        # endpoint: nama route untuk histogram, mis. "GET /reputation/{id}";
+        # latensi termasuk menunggu koneksi bebas di pool client
+        started = time.perf_counter()
+        status = "error"
+        try:
+            res = await self.client.request(method, path, **kwargs)
+            status = res.status_code
+            return res
+        except httpx.HTTPError:
+            return None
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.histograms.setdefault(endpoint, LatencyHistogram()).record(elapsed_ms, status)
+
+    async def connect(self, src: str, tgt: str, success: bool):
+        payload = {"device_id": src, "connected_device_id": tgt, "status": success, "connection_type": "data_exchange"}
+        return await self.request("POST", "POST /connect", "/connect", json=payload)
+
+    async def rate(self, rater: str, target: str, score: float):
+        payload = {"rater_device_id": rater, "rated_device_id": target, "score": score}
+        return await self.request("POST", "POST /rate_peer/", "/rate_peer/", json=payload)
+
+    async def reputation(self, device_id: str) -> dict:
+        res = await self.request("GET", "GET /reputation/{id}", f"/reputation/{device_id}")
+        return res.json() if res is not None and res.status_code == 200 else {"exists": False}
+
+    async def coordinator_id(self):
+        res = await self.request("GET", "GET /coordinator", "/coordinator")
+        return res.json()["id"] if res is not None and res.status_code == 200 else None
+
+    # --- perilaku device ---
+
+    async def normal_interaction(self, src: str):
+        tgt = self.pick_other(self.device_ids, src)
+        success = self.rng.random() < 0.9
+        await self.connect(src, tgt, success)
+        tgt_reputation, src_reputation = await asyncio.gather(self.reputation(tgt), self.reputation(src))
+        score_1 = smart_score(tgt_reputation, success, self.rng)
+        if tgt in self.malicious_set:
+            score_2 = round(self.rng.uniform(0.1, 0.3), 2)
+        else:
+            score_2 = smart_score(src_reputation, success, self.rng)
+        await asyncio.gather(self.rate(src, tgt, score_1), self.rate(tgt, src, score_2))
+
+    async def badmouth(self, src: str):
+        tgt = self.pick_other(self.normal_ids, src)
+        await self.connect(src, tgt, True)
+        await self.rate(src, tgt, round(self.rng.uniform(0.1, 0.2), 2))
+        score = smart_score(await self.reputation(src), True, self.rng)
+        await self.rate(tgt, src, score)
+
+    async def flood(self, src: str):
+        targets = [self.pick_other(self.normal_ids, src) for _ in range(FLOOD_BURST)]
+        await asyncio.gather(*(self.connect(src, tgt, True) for tgt in targets))
+
+    async def hijack(self, src: str):
+        coordinator = await self.coordinator_id()
+        if not coordinator or coordinator == src:
+            return await self.badmouth(src)
+        await self.connect(src, coordinator, True)
+        await self.rate(src, coordinator, 0.0)
+
+    async def collusion(self, src: str):
+        tgt = self.pick_other(self.malicious_ids, src)
+        await self.connect(src, tgt, True)
+        await self.rate(src, tgt, 1.0)
+
+    def pick_other(self, candidates: list, device_id: str) -> str:
+        if len(candidates) < 2 and device_id in candidates:
+            candidates = self.device_ids
+        while True:
+            choice = self.rng.choice(candidates)
+            if choice != device_id:
+                return choice
+
+    def next_action(self):
+        src = self.rng.choice(self.device_ids)
+        if src not in self.malicious_set:
+            return "normal", self.normal_interaction, src
+        name = self.rng.choices(list(self.attack_mix), weights=list(self.attack_mix.values()))[0]
+        return name, getattr(self, name), src
+
+    # --- fase ---
+
+    async def register_devices(self, device_ids: list, concurrency: int) -> list:
+        """
+        Closed-loop dengan batas concurrency; 3 device pertama RSU seperti initialize_devices.
+        Request yang gagal karena server (5xx, timeout) dicoba ulang. Mengembalikan device yang
+        berhasil terdaftar (device dengan trust awal terlalu rendah ditolak dengan 403).
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        payloads = [
+            device_payload(device_id, "RSU", "internal", rng=self.rng) if index < 3 else device_payload(device_id, rng=self.rng)
+            for index, device_id in enumerate(device_ids)
+        ]
+
+        async def register(payload):
+            async with semaphore:
+                for attempt in range(REGISTER_ATTEMPTS):
+                    if attempt:
+                        await asyncio.sleep(self.rng.uniform(0.05, 0.2) * attempt)
+                    res = await self.request("POST", "POST /device", "/device", json=payload)
+                    if res is None or res.status_code >= 500:
+                        continue
+                    if res.status_code == 200:
+                        return True
+                    # percobaan sebelumnya sudah menyimpan device sebelum gagal
+                    return attempt > 0 and "already exists and is active" in res.text
+                return False
+
+        results = await asyncio.gather(*(register(p) for p in payloads))
+        return [device_id for device_id, ok in zip(device_ids, results) if ok]
+
+    def classify(self, device_ids: list, malicious_ratio: float):
+        # device jahat dipilih dari non-RSU
+        self.device_ids = device_ids
+        others = device_ids[3:]
+        self.malicious_ids = self.rng.sample(others, min(int(len(device_ids) * malicious_ratio), len(others)))
+        self.malicious_set = set(self.malicious_ids)
+        self.normal_ids = [d for d in device_ids if d not in self.malicious_set]
+
+    async def _run_action(self, action, src: str):
+        try:
+            await action(src)
+        finally:
+            self.in_flight -= 1
+
+    async def run_open_loop(self, rps: float, duration: float):
+        """
+        Interaksi dimulai pada waktu kedatangan Poisson (jarak eksponensial, rata-rata 1/rps)
+        tanpa menunggu yang sebelumnya. Jika sudah ada max_in_flight interaksi berjalan,
+        kedatangan dihitung sebagai dropped: backend tidak mampu mengikuti laju target.
+        """
+        tasks = set()
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        next_arrival = start
+        while True:
+            next_arrival += self.rng.expovariate(rps)
+            if next_arrival - start >= duration:
+                break
+            delay = next_arrival - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            name, action, src = self.next_action()
+            if self.in_flight >= self.max_in_flight:
+                self.dropped += 1
+                continue
+            self.in_flight += 1
+            self.started += 1
+            self.actions[name] = self.actions.get(name, 0) + 1
+            task = asyncio.create_task(self._run_action(action, src))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        arrival_seconds = loop.time() - start
+        if tasks:
+            await asyncio.gather(*tasks)
+        return arrival_seconds, loop.time() - start
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in ("badmouth", "flood", "hijack", "collusion"):
+            raise argparse.ArgumentTypeError(f"Unknown attack '{name}'")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("Attack mix needs at least one positive weight")
+    return mix
+
+def print_report(generator: LoadGenerator, arrival_seconds: float, elapsed: float, target_rps: float):
+    # req/s dihitung atas seluruh waktu, termasuk menunggu interaksi terakhir selesai
+    print("\n" + "="*110)
+    # --duration 0: tidak ada fase kedatangan
+    started_rps = generator.started / arrival_seconds if arrival_seconds > 0 else 0.0
+    print(f"Target: {target_rps:.0f} interactions/s | Started: {generator.started} "
+          f"({started_rps:.1f}/s) | Dropped: {generator.dropped} | Elapsed: {elapsed:.1f}s")
+    print(f"Actions: {generator.actions}")
+    print("="*110)
+    print(f"{'endpoint':<24}{'count':>9}{'req/s':>9}{'errors':>8}{'mean':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>10}  statuses")
+    for endpoint, histogram in sorted(generator.histograms.items()):
+        s = histogram.summary()
+        print(f"{endpoint:<24}{s['count']:>9}{s['count'] / elapsed if elapsed > 0 else 0.0:>9.1f}{s['errors']:>8}"
+              f"{s['mean_ms']:>9.1f}{s['p50_ms']:>9.1f}{s['p90_ms']:>9.1f}{s['p99_ms']:>9.1f}{s['max_ms']:>10.1f}"
+              f"  {s['statuses']}")
+    print("(latency in ms; errors = 5xx and transport errors)")
+
+async def main_async(args):
+    rng = random.Random(args.seed)
+    # keep-alive ditutup client sebelum timeout keep-alive uvicorn (5 s) agar koneksi basi tidak dipakai
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections, keepalive_expiry=4)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        generator = LoadGenerator(client, rng, args.attack_mix, args.max_in_flight)
+        device_ids = [f"{args.prefix}-{i:05}" for i in range(args.devices)]
+
+        if not args.skip_register:
+            print(f"📥  Registering {len(device_ids)} devices...")
+            started = time.perf_counter()
+            device_ids = await generator.register_devices(device_ids, args.register_concurrency)
+            print(f"📥  {len(device_ids)} of {args.devices} registered in {time.perf_counter() - started:.1f}s")
+            registration = generator.histograms.pop("POST /device")
+            print(f"    POST /device p50 {registration.percentile(50):.1f} ms, p99 {registration.percentile(99):.1f} ms, "
+                  f"errors {registration.errors}")
+        if len(device_ids) < 2:
+            print("❌  Not enough registered devices. Stopping.")
+            return
+
+        generator.classify(device_ids, args.malicious_ratio)
+        print(f"🔴  Malicious: {len(generator.malicious_ids)} | 🟢 Normal: {len(generator.normal_ids)}")
+        print(f"🚀  Open-loop load: {args.rps} interactions/s for {args.duration}s")
+        arrival_seconds, elapsed = await generator.run_open_loop(args.rps, args.duration)
+
+    print_report(generator, arrival_seconds, elapsed, args.rps)
+    if args.output:
+        result = {
+            "target_rps": args.rps,
+            "arrival_seconds": round(arrival_seconds, 3),
+            "elapsed_seconds": round(elapsed, 3),
+            "started": generator.started,
+            "dropped": generator.dropped,
+            "actions": generator.actions,
+            "endpoints": {endpoint: h.summary() for endpoint, h in generator.histograms.items()},
+        }
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Result written to {args.output}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator open-loop untuk backend trust")
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--devices", type=int, default=TOTAL_DEVICES)
+    parser.add_argument("--malicious-ratio", type=float, default=MALICIOUS_PERCENT)
+    parser.add_argument("--rps", type=float, default=50, help="laju kedatangan interaksi per detik")
+    parser.add_argument("--duration", type=float, default=30, help="lama fase beban (detik)")
+    parser.add_argument("--attack-mix", type=parse_mix, default=parse_mix(DEFAULT_ATTACK_MIX),
+                        help="bobot serangan device jahat: badmouth, flood, hijack, collusion")
+    parser.add_argument("--max-in-flight", type=int, default=2000, help="interaksi berjalan maksimum sebelum kedatangan di-drop")
+    parser.add_argument("--connections", type=int, default=200, help="koneksi HTTP keep-alive maksimum")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--register-concurrency", type=int, default=8)
+    parser.add_argument("--skip-register", action="store_true", help="device dengan prefix yang sama sudah terdaftar")
+    parser.add_argument("--prefix", default="load")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="simpan ringkasan dan histogram (JSON) ke file")
+    asyncio.run(main_async(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
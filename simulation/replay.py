@@ -0,0 +1,348 @@
+# python replay.py scenario2_badmouthing --seed 42 [--devices 2000] [--quiet] [--output hasil.json]
+#
+# Menjalankan skenario simulasi tanpa HTTP: request dari test_utils diteruskan langsung ke
+# app.services (trust engine in-process dari trust-service/logic.py) dengan database SQLite
+# in-memory, RNG dengan seed tetap, clock virtual dan eksekusi serial. Seed dan parameter
+# yang sama selalu menghasilkan state akhir yang sama.
+
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import random
+import re
+import sys
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+# urutan iterasi set (mis. list(malicious_ids)[0] di skenario) bergantung pada hash string
+if os.environ.get("PYTHONHASHSEED") in (None, "", "random"):
+    os.environ["PYTHONHASHSEED"] = "0"
+    os.execv(sys.executable, [sys.executable] + sys.argv)
+
+SIMULATION_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(SIMULATION_DIR))
+
+# waktu virtual yang dihabiskan satu request (kira-kira satu round trip HTTP lokal)
+REPLAY_TICK_SECONDS = float(os.getenv("REPLAY_TICK_SECONDS", "0.01"))
+# awal clock virtual
+REPLAY_START = datetime(2024, 1, 1)
+
+class VirtualClock:
+    # waktu hanya maju lewat advance/sleep; setiap utcnow() maju 1 mikrodetik agar
+    # baris yang dibuat berurutan tetap punya timestamp berbeda seperti pada jam asli
+    def __init__(self, start: datetime = REPLAY_START):
+        self.start = start
+        self.elapsed = 0.0
+        self._micros = 0
+
+    def advance(self, seconds: float):
+        self.elapsed += seconds
+
+    def sleep(self, seconds: float):
+        self.advance(seconds)
+
+    def monotonic(self) -> float:
+        return self.elapsed
+
+    def time(self) -> float:
+        return (self.start - datetime(1970, 1, 1)).total_seconds() + self.elapsed
+
+    def utcnow(self) -> datetime:
+        self._micros += 1
+        return self.start + timedelta(seconds=self.elapsed, microseconds=self._micros)
+
+class SerialExecutor:
+    # pengganti ThreadPoolExecutor di skenario: task dijalankan langsung saat submit
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+class LocalResponse:
+    def __init__(self, status_code: int, body, headers: dict = None):
+        self.status_code = status_code
+        self._body = body
+        self.headers = headers or {}
+
+    def json(self):
+        return self._body
+
+    @property
+    def text(self):
+        return json.dumps(self._body, default=str)
+
+def setup_environment(database_url: str, quiet: bool = False):
+    # harus sebelum app di-import: konfigurasi app dibaca saat import
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["TRUST_ENGINE"] = "inprocess"
+    os.environ["WRITE_QUEUE_ENABLED"] = "false"
+    os.environ["FLOOD_COUNTER_BACKEND"] = "memory"
+    os.environ.setdefault("LOG_LEVEL", "ERROR" if quiet else "WARNING")
+    os.environ.setdefault("LOG_FILE", os.devnull)
+
+def install_clock(clock: VirtualClock):
+    # semua sumber waktu di jalur tulis memakai clock virtual
+    from app import services, rate_counter
+    from app.database import Base
+    from app.cache import device_cache, coordinator_slot
+
+    class ClockDatetime(datetime):
+        @classmethod
+        def utcnow(cls):
+            return clock.utcnow()
+
+    services.datetime = ClockDatetime
+    for table in Base.metadata.tables.values():
+        for column in table.columns:
+            for default in (column.default, column.onupdate):
+                if default is not None and default.is_callable:
+                    default.arg = lambda context: clock.utcnow()
+
+    rate_counter.set_flood_counter(rate_counter.SlidingWindowCounter(clock=clock.monotonic))
+    for component in (device_cache, coordinator_slot, services.coordinator_ranking):
+        component.clock = clock.monotonic
+
+class InProcessClient:
+    """
+    Pengganti modul requests untuk test_utils: get/post dengan URL backend dicocokkan
+    ke route yang sama seperti app.main dan dijalankan langsung dengan app.services.
+    """
+    def __init__(self, clock: VirtualClock, tick: float = REPLAY_TICK_SECONDS):
+        from app import services
+        from app.database import SessionLocal
+        from app.main import DeviceCreate, ConnectionCreate, PeerRatingCreate
+
+        self.clock = clock
+        self.tick = tick
+        self.services = services
+        self.session_factory = SessionLocal
+        self.schemas = SimpleNamespace(device=DeviceCreate, connection=ConnectionCreate, rating=PeerRatingCreate)
+        self.request_counts = {}
+        self.routes = [
+            ("GET", r"/devices/", self._list_devices),
+            ("GET", r"/coordinator", self._coordinator),
+            ("GET", r"/reputation/(?P<device_id>[^/]+)", self._reputation),
+            ("POST", r"/device", self._add_device),
+            ("POST", r"/device/(?P<device_id>[^/]+)/leave", self._leave_device),
+            ("POST", r"/connect", self._connect),
+            ("POST", r"/connect/batch", self._connect_batch),
+            ("POST", r"/rate_peer/", self._rate_peer),
+            ("POST", r"/rate_peer/batch", self._rate_peer_batch),
+        ]
+
+    def get(self, url, params=None, **kwargs):
+        return self._request("GET", url, params=params)
+
+    def post(self, url, json=None, **kwargs):
+        return self._request("POST", url, payload=json)
+
+    def _request(self, method: str, url: str, params: dict = None, payload=None) -> LocalResponse:
+        path = urlsplit(url).path
+        self.clock.advance(self.tick)
+        for route_method, pattern, handler in self.routes:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                key = f"{method} {pattern}"
+                self.request_counts[key] = self.request_counts.get(key, 0) + 1
+                session = self.session_factory()
+                try:
+                    return handler(session, payload=payload, params=params or {}, **match.groupdict())
+                except Exception as e:
+                    session.rollback()
+                    return LocalResponse(500, {"detail": str(e)})
+                finally:
+                    session.close()
+        return LocalResponse(404, {"detail": "Not Found"})
+
+    def _list_devices(self, session, params, **_):
+        fields = params.get("fields")
+        devices, _ = self.services.list_devices(session, fields.split(",") if fields else None)
+        return LocalResponse(200, devices)
+
+    def _coordinator(self, session, **_):
+        coordinator_id = self.services.get_coordinator_id(session)
+        if not coordinator_id:
+            return LocalResponse(404, {"detail": "No coordinator found"})
+        return LocalResponse(200, {"id": coordinator_id})
+
+    def _reputation(self, session, device_id, **_):
+        info = self.services.get_device_reputation_info(session, device_id)
+        if not info["exists"]:
+            return LocalResponse(404, {"detail": f"Device with id {device_id} not found"})
+        return LocalResponse(200, info)
+
+    def _add_device(self, session, payload, **_):
+        try:
+            device = self.services.add_device(session, self.schemas.device(**payload))
+        except ValueError as e:
+            return LocalResponse(403, {"detail": str(e)})
+        return LocalResponse(200, {"id": device.id, "trust_score": device.trust_score})
+
+    def _leave_device(self, session, device_id, **_):
+        try:
+            self.services.leave_device(session, device_id)
+        except ValueError as e:
+            return LocalResponse(400, {"detail": str(e)})
+        return LocalResponse(200, {"message": f"Device {device_id} has left the system."})
+
+    def _connection_data(self, payload) -> dict:
+        conn = self.schemas.connection(**payload)
+        return {
+            "source_id": conn.device_id,
+            "target_id": conn.connected_device_id,
+            "status": conn.status,
+            "connection_type": conn.connection_type
+        }
+
+    def _connect(self, session, payload, **_):
+        return LocalResponse(200, self.services.record_connection(session, self._connection_data(payload)))
+
+    def _connect_batch(self, session, payload, **_):
+        return LocalResponse(200, self.services.record_connection(session, [self._connection_data(p) for p in payload]))
+
+    def _rate_peer(self, session, payload, **_):
+        rating = self.schemas.rating(**payload)
+        self.services.add_peer_rating(
+            session, rating.rater_device_id, rating.rated_device_id, rating.score,
+            reason=rating.comment, update_trust=rating.update_trust
+        )
+        return LocalResponse(200, {"message": "Peer rating recorded"})
+
+    def _rate_peer_batch(self, session, payload, **_):
+        ratings = [self.schemas.rating(**p) for p in payload]
+        results = self.services.add_peer_ratings(session, [{
+            "rater_id": r.rater_device_id,
+            "rated_id": r.rated_device_id,
+            "score": r.score,
+            "reason": r.comment
+        } for r in ratings])
+        recorded = sum(1 for r in results if r["status"] == "recorded")
+        return LocalResponse(200, {"message": f"{recorded} of {len(ratings)} peer ratings recorded", "results": results})
+
+def load_scenario(name: str, clock: VirtualClock, devices: int = None, override_ratio: float = None):
+    """
+    Import modul skenario dan ganti sleep, ThreadPoolExecutor dan initialize_devices-nya.
+    Mengembalikan (modul, classification); classification diisi saat skenario memanggil
+    initialize_devices.
+    """
+    import test_utils
+    module = importlib.import_module(name)
+    module.time = SimpleNamespace(sleep=clock.sleep, time=clock.time, monotonic=clock.monotonic)
+    if hasattr(module, "ThreadPoolExecutor"):
+        module.ThreadPoolExecutor = SerialExecutor
+
+    classification = {}
+    original = module.initialize_devices
+
+    def initialize_devices(total=test_utils.TOTAL_DEVICES, malicious_ratio=test_utils.MALICIOUS_PERCENT):
+        device_ids, malicious_ids = original(
+            total=devices or total,
+            malicious_ratio=malicious_ratio if override_ratio is None else override_ratio
+        )
+        classification["device_ids"] = device_ids
+        classification["malicious_ids"] = malicious_ids
+        return device_ids, malicious_ids
+
+    module.initialize_devices = initialize_devices
+    return module, classification
+
+def final_state(classification: dict) -> dict:
+    from app import services
+    from app.database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        devices, _ = services.list_devices(
+            session, ["trust_score", "is_blacklisted", "is_flagged", "suspicious_count", "is_coordinator", "is_active"]
+        )
+        coordinator_id = services.get_coordinator_id(session)
+    finally:
+        session.close()
+
+    malicious_ids = classification.get("malicious_ids", set())
+    return {
+        "coordinator": coordinator_id,
+        "devices": len(devices),
+        "malicious": len(malicious_ids),
+        "blacklisted": sum(1 for d in devices if d["is_blacklisted"]),
+        "malicious_blacklisted": sum(1 for d in devices if d["is_blacklisted"] and d["id"] in malicious_ids),
+        "normal_blacklisted": sum(1 for d in devices if d["is_blacklisted"] and d["id"] not in malicious_ids),
+        "flagged": sum(1 for d in devices if d["is_flagged"]),
+        "device_states": [dict(d, malicious=d["id"] in malicious_ids) for d in devices],
+    }
+
+def run_replay(scenario: str, seed: int, devices: int = None, malicious_ratio: float = None,
+               tick: float = REPLAY_TICK_SECONDS, quiet: bool = False) -> dict:
+    clock = VirtualClock()
+    install_clock(clock)
+
+    import test_utils
+    client = InProcessClient(clock, tick)
+    test_utils.set_client(client)
+
+    module, classification = load_scenario(scenario, clock, devices, malicious_ratio)
+    random.seed(seed)
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(open(os.devnull, "w")) if quiet else contextlib.nullcontext():
+        module.run_simulation()
+    wall_seconds = time.perf_counter() - started
+
+    result = final_state(classification)
+    result.update({
+        "scenario": scenario,
+        "seed": seed,
+        "requests": sum(client.request_counts.values()),
+        "requests_by_route": client.request_counts,
+        "virtual_seconds": round(clock.elapsed, 3),
+        "wall_seconds": round(wall_seconds, 3),
+    })
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay skenario simulasi in-process (tanpa HTTP)")
+    parser.add_argument("scenario", help="nama modul skenario, mis. scenario2_badmouthing")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--devices", type=int, help="override jumlah device di initialize_devices")
+    parser.add_argument("--malicious-ratio", type=float, help="override rasio device jahat")
+    parser.add_argument("--tick", type=float, default=REPLAY_TICK_SECONDS, help="detik virtual per request")
+    parser.add_argument("--database-url", default="sqlite://", help="default: SQLite in-memory")
+    parser.add_argument("--quiet", action="store_true", help="sembunyikan output skenario")
+    parser.add_argument("--output", help="simpan hasil (JSON) ke file")
+    args = parser.parse_args()
+
+    setup_environment(args.database_url, args.quiet)
+    sys.path.insert(0, SIMULATION_DIR)
+    result = run_replay(args.scenario, args.seed, args.devices, args.malicious_ratio, args.tick, args.quiet)
+
+    print("\n" + "="*50)
+    print(f"REPLAY {result['scenario']} (seed {result['seed']})")
+    print("="*50)
+    print(f"Devices: {result['devices']} | Malicious: {result['malicious']} | Coordinator: {result['coordinator']}")
+    print(f"Blacklisted: {result['blacklisted']} (malicious {result['malicious_blacklisted']}, normal {result['normal_blacklisted']}) | Flagged: {result['flagged']}")
+    print(f"Requests: {result['requests']} | Virtual time: {result['virtual_seconds']:.1f}s | Wall time: {result['wall_seconds']:.2f}s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2, default=str)
+        print(f"Result written to {args.output}")
+
+if __name__ == "__main__":
+    main()
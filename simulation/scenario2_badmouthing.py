@@ -2,34 +2,11 @@ import random
 import time
 from test_utils import (
     initialize_devices, create_connection,
-    rate_peer, get_all_devices, get_reputation
+    rate_peer, get_all_devices, get_reputation, smart_score
 )
 
 def calculate_smart_score(target_id: str, connection_success: bool) -> float:
-    target_reputation = get_reputation(target_id)
-    
-    if not target_reputation or not target_reputation.get("exists"):
-        return 0.5  
-
-    if connection_success:
-        base_score = random.uniform(0.7, 1.0)
-    else:
-        base_score = random.uniform(0.1, 0.4)
-        
-    reputation_level = target_reputation.get("reputation_level", "AVERAGE")
-        
-    if reputation_level == "BLACKLISTED":
-        adjusted_score = min(base_score, 0.1)
-    elif reputation_level == "VERY_SUSPICIOUS":
-        adjusted_score = min(base_score, 0.15)
-    elif reputation_level == "SUSPICIOUS":
-        adjusted_score = min(base_score, random.uniform(0.3, 0.5))
-    elif reputation_level == "POOR":
-        adjusted_score = base_score * 0.9
-    else: 
-        adjusted_score = base_score
-        
-    return round(max(0.0, min(1.0, adjusted_score)), 2)
+    return smart_score(get_reputation(target_id), connection_success)
 
 
 def run_simulation():
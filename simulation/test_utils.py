@@ -1,11 +1,10 @@
 import requests
 import random
-import time
 import os
 
 BASE_URL = os.getenv("BASE_URL", "http://localhost:8000")
-TOTAL_DEVICES = 10
-MALICIOUS_PERCENT = 0.25
+TOTAL_DEVICES = int(os.getenv("TOTAL_DEVICES", "10"))
+MALICIOUS_PERCENT = float(os.getenv("MALICIOUS_PERCENT", "0.25"))
 DEVICE_BEHAVIOR = {
     "RSU": ["propagate_info", "sync_trust"],
     "Smartphone": ["send_location", "ping_rsu"],
@@ -14,48 +13,85 @@ DEVICE_BEHAVIOR = {
     "Smart Device": ["request_update"],
     "RFID": ["send_identity"]
 }
-            
-def get_all_devices():
+
+# transport untuk semua request ke backend; replay.py memakai client in-process
+# dengan method get/post yang sama
+client = requests
+
+def set_client(new_client):
+    global client
+    client = new_client
+
+def get_all_devices(fields=None):
+    # /devices/ dipaginasi; halaman berikutnya diambil selama ada header X-Next-Cursor
+    devices = []
+    params = {"fields": ",".join(fields)} if fields else {}
     try:
-        res = requests.get(f"{BASE_URL}/devices/")
-        if res.status_code == 200:
-            return res.json()
+        while True:
+            res = client.get(f"{BASE_URL}/devices/", params=params)
+            if res.status_code != 200:
+                break
+            devices.extend(res.json())
+            cursor = res.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+            params["cursor"] = cursor
     except Exception as e:
         print(f"❌ Error getting all devices: {e}")
-    return []
+    return devices
     
 def get_coordinator_id():
     try:
-        res = requests.get(f"{BASE_URL}/coordinator")
+        res = client.get(f"{BASE_URL}/coordinator")
         return res.json()["id"] if res.status_code == 200 else None
     except Exception:
         return None
 
 def get_reputation(device_id: str):
     try:
-        res = requests.get(f"{BASE_URL}/reputation/{device_id}")
+        res = client.get(f"{BASE_URL}/reputation/{device_id}")
         if res.status_code == 200:
             return res.json()
-    except Exception as e:
+    except Exception:
         pass
     return {"exists": False}
 
-def register_device(device_id, device_type=None, ownership_type=None):
+def smart_score(reputation: dict, connection_success: bool, rng=random) -> float:
+    # rating dari device normal: tinggi jika koneksi sukses, dibatasi oleh reputasi target
+    if not reputation or not reputation.get("exists"):
+        return 0.5
+
+    base_score = rng.uniform(0.7, 1.0) if connection_success else rng.uniform(0.1, 0.4)
+    level = reputation.get("reputation_level", "AVERAGE")
+    if level == "BLACKLISTED":
+        base_score = min(base_score, 0.1)
+    elif level == "VERY_SUSPICIOUS":
+        base_score = min(base_score, 0.15)
+    elif level == "SUSPICIOUS":
+        base_score = min(base_score, rng.uniform(0.3, 0.5))
+    elif level == "POOR":
+        base_score = base_score * 0.9
+    return round(max(0.0, min(1.0, base_score)), 2)
+
+def device_payload(device_id, device_type=None, ownership_type=None, rng=random):
     if not device_type:
-        device_type = random.choice(list(DEVICE_BEHAVIOR.keys()))
+        device_type = rng.choice(list(DEVICE_BEHAVIOR.keys()))
     if not ownership_type:
-        ownership_type = "internal" if device_type == "RSU" else random.choice(["internal", "external"])
+        ownership_type = "internal" if device_type == "RSU" else rng.choice(["internal", "external"])
         
-    payload = {
+    return {
         "id": device_id,
         "name": f"{device_type}-{device_id}",
         "ownership_type": ownership_type,
         "device_type": device_type,
-        "memory_gb": random.choice([2, 4, 8]),
-        "location": random.choice(["A", "B", "C"])
+        "memory_gb": rng.choice([2, 4, 8]),
+        "location": rng.choice(["A", "B", "C"])
     }
+
+def register_device(device_id, device_type=None, ownership_type=None):
+    payload = device_payload(device_id, device_type, ownership_type)
     try:
-        res = requests.post(f"{BASE_URL}/device", json=payload)
+        res = client.post(f"{BASE_URL}/device", json=payload)
         if res.status_code == 200:
             print(f"📥  Register OK: {device_id} ({device_type})")
             return res.json()
@@ -102,19 +138,42 @@ def create_connection(src, tgt, success=True):
         "connection_type": "data_exchange"
     }
     try:
-        res = requests.post(f"{BASE_URL}/connect", json=payload)
-        status_icon = "✅" if success else "❌"
+        client.post(f"{BASE_URL}/connect", json=payload)
     except Exception as e:
         print(f"💥 ERROR creating connection: {e}")
 
 def rate_peer(rater, target, score):
     payload = { "rater_device_id": rater, "rated_device_id": target, "score": score }
     try:
-        res = requests.post(f"{BASE_URL}/rate_peer/", json=payload)
-        # print(f"  ⭐ {rater} rates {target} with {score:.1f} -> {res.status_code}")
+        client.post(f"{BASE_URL}/rate_peer/", json=payload)
     except Exception as e:
         print(f"💥 ERROR rating peer: {e}")
 
+def create_connections(interactions):
+    # interactions: list of (src, tgt, success), dikirim dalam satu request
+    payload = [{
+        "device_id": src,
+        "connected_device_id": tgt,
+        "status": success,
+        "connection_type": "data_exchange"
+    } for src, tgt, success in interactions]
+    try:
+        res = client.post(f"{BASE_URL}/connect/batch", json=payload)
+        return res.json().get("results", [])
+    except Exception as e:
+        print(f"💥 ERROR creating connection batch: {e}")
+        return []
+
+def rate_peers(ratings):
+    # ratings: list of (rater, target, score), dikirim dalam satu request
+    payload = [{"rater_device_id": rater, "rated_device_id": target, "score": score} for rater, target, score in ratings]
+    try:
+        res = client.post(f"{BASE_URL}/rate_peer/batch", json=payload)
+        return res.json().get("results", [])
+    except Exception as e:
+        print(f"💥 ERROR rating peer batch: {e}")
+        return []
+
 def simulate_interaction(src, tgt, success):
     # 1. Buat koneksi
     create_connection(src, tgt, success=success)
@@ -134,7 +193,7 @@ def simulate_interaction(src, tgt, success):
         
 def leave_device(device_id):
     try:
-        res = requests.post(f"{BASE_URL}/device/{device_id}/leave")
+        res = client.post(f"{BASE_URL}/device/{device_id}/leave")
         if res.status_code == 200:
             print(f"🚪  Device {device_id} has left the network.")
         else:
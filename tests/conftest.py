@@ -0,0 +1,36 @@
+# pytest tests/
+# env diset sebelum modul app diimpor: database dan log default (/data/...) tidak ada di mesin test
+import os
+import sys
+import tempfile
+import pytest
+
+_TMP = tempfile.mkdtemp(prefix="trust-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_TMP}/trust_system.db")
+os.environ.setdefault("LOG_FILE", os.path.join(_TMP, "logs.log"))
+os.environ.setdefault("TRUST_ENGINE", "inprocess")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def reset_database():
+    # skema di database DATABASE_URL, semua tabel dikosongkan
+    from app.database import Base, engine
+    from app import migrations, services
+    migrations.upgrade(engine)
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    services.device_cache.invalidate()
+    services.coordinator_slot.invalidate()
+    services.coordinator_ranking.invalidate()
+
+@pytest.fixture
+def db():
+    from app.database import SessionLocal
+    reset_database()
+    yield SessionLocal
+
+@pytest.fixture
+def reset_db():
+    # untuk test yang membandingkan beberapa run di database kosong
+    return reset_database
@@ -0,0 +1,94 @@
+# pemilihan koordinator bersamaan dari beberapa session (worker) harus menghasilkan satu koordinator
+# SQLite: database DATABASE_URL sementara; PostgreSQL: DATABASE_URL=postgresql://... pytest tests/
+import threading
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from app.cache import read_coordinator_epoch
+from app.models import Device
+from app import services
+
+def _add_candidates(SessionLocal, count=3):
+    with SessionLocal() as session:
+        for i in range(count):
+            session.add(Device(
+                id=f"RSU-{i}", name=f"RSU {i}", ownership_type="internal", device_type="RSU",
+                trust_score=0.9 - i * 0.1
+            ))
+        session.commit()
+
+def _coordinators(SessionLocal) -> list:
+    with SessionLocal() as session:
+        return session.execute(select(Device.id).where(Device.is_coordinator == True)).scalars().all()
+
+def _elect_concurrently(SessionLocal, workers: int) -> list:
+    barrier = threading.Barrier(workers)
+    results, errors = [None] * workers, []
+
+    def run(index):
+        with SessionLocal() as session:
+            barrier.wait()
+            try:
+                elected = services.select_coordinator(session)
+                results[index] = elected.id if elected else None
+                session.commit()
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    return results
+
+def test_concurrent_elections_pick_one_coordinator(db):
+    _add_candidates(db)
+    results = _elect_concurrently(db, workers=4)
+    assert results == ["RSU-0"] * 4
+    assert _coordinators(db) == ["RSU-0"]
+
+def test_concurrent_reelection_after_coordinator_drops(db):
+    _add_candidates(db)
+    with db() as session:
+        services.select_coordinator(session)
+        session.get(Device, "RSU-0").trust_score = 0.1
+        session.commit()
+
+    results = _elect_concurrently(db, workers=4)
+    assert results == ["RSU-1"] * 4
+    assert _coordinators(db) == ["RSU-1"]
+    with db() as session:
+        # satu pemilihan yang mengganti koordinator, sisanya melihat RSU-1 sudah terpilih
+        assert read_coordinator_epoch(session) == 2
+
+def test_election_stays_in_callers_transaction(db):
+    # pemilihan tidak meng-commit transaksi pemanggil; rollback membatalkannya
+    _add_candidates(db)
+    with db() as session:
+        assert services.select_coordinator(session).id == "RSU-0"
+        session.rollback()
+    assert _coordinators(db) == []
+    with db() as session:
+        assert read_coordinator_epoch(session) == 0
+        assert services.get_coordinator_id(session) is None
+
+def test_election_without_candidates_keeps_epoch(db):
+    # tanpa kandidat dan tanpa koordinator lama tidak ada yang berubah
+    with db() as session:
+        session.add(Device(id="S-0", name="S 0", ownership_type="external", device_type="Sensor", trust_score=0.9))
+        session.commit()
+        assert services.select_coordinator(session) is None
+        session.commit()
+        assert read_coordinator_epoch(session) == 0
+        assert "pending_coordinator" not in session.info
+
+def test_single_coordinator_index(db):
+    _add_candidates(db)
+    with db() as session:
+        session.get(Device, "RSU-0").is_coordinator = True
+        session.get(Device, "RSU-1").is_coordinator = True
+        with pytest.raises(IntegrityError):
+            session.commit()
+    assert _coordinators(db) == []
@@ -0,0 +1,11 @@
+# semua hot query harus memakai index setelah migrasi
+from app.database import make_engine
+from app.migrations import check_query_plans, upgrade
+
+def test_hot_queries_use_indexes(tmp_path):
+    engine = make_engine(f"sqlite:///{tmp_path}/trust_system.db")
+    try:
+        upgrade(engine)
+        assert check_query_plans(engine) == {}
+    finally:
+        engine.dispose()
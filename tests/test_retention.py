@@ -0,0 +1,40 @@
+# retensi tidak boleh mengubah peer_evaluations yang dipakai perhitungan trust
+from datetime import datetime, timedelta
+from app import services
+from app.database import engine
+from app.models import Connection, Device, PeerRating
+from app.retention import run_retention
+
+NOW = datetime(2024, 6, 1)
+RATERS = ["A", "B", "C", "E", "F", "P"]
+
+def _evaluations(SessionLocal) -> dict:
+    with SessionLocal() as session:
+        device = session.get(Device, "D")
+        return {peer: services._peer_evaluations(session, device, peer) for peer in RATERS}
+
+def test_retention_keeps_peer_evaluations(db, tmp_path):
+    old = NOW - timedelta(days=90)
+    with db() as session:
+        for device_id in ["D"] + RATERS:
+            session.add(Device(id=device_id, name=device_id, ownership_type="internal", device_type="Computer", trust_score=0.7))
+        # 5 rating lama dari rater berbeda, lalu 25 rating yang lebih baru dari P
+        ratings = [(rater, 0.2) for rater in "ABCEF"] + [("P", 0.9)] * 25
+        for i, (rater, score) in enumerate(ratings):
+            timestamp = old + timedelta(minutes=i)
+            connection = Connection(source_device_id=rater, target_device_id="D", status=True, timestamp=timestamp)
+            session.add(connection)
+            session.flush()
+            session.add(PeerRating(
+                rater_device_id=rater, rated_device_id="D", score=score,
+                timestamp=timestamp, connection_id=connection.id
+            ))
+        session.commit()
+
+    before = _evaluations(db)
+    assert len(before["P"]) == 5
+    result = run_retention(engine, archive_dir=str(tmp_path), now=NOW)
+    services.device_cache.invalidate()
+    assert _evaluations(db) == before
+    # hanya 5 rating terbaru P yang tersisa dari rating P
+    assert result["peer_ratings"]["rows"] == 20
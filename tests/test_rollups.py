@@ -0,0 +1,34 @@
+# rollup trust_history hanya untuk dialect dengan upsert; dialect lain ditolak saat startup
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_mock_engine
+from app import migrations, rollups
+from app.database import engine
+from app.models import Connection, Device, TrustHistory
+
+def test_upgrade_rejects_unsupported_dialect():
+    engine = create_mock_engine("mysql://", lambda *args, **kwargs: None)
+    with pytest.raises(RuntimeError, match="not implemented for mysql"):
+        migrations.upgrade(engine)
+
+def test_history_rolled_up_in_same_transaction(db):
+    with db() as session:
+        for second, trust in ((1, 0.5), (2, 0.7), (61, 0.6)):
+            session.add(TrustHistory(device_id="D", trust_score=trust, timestamp=datetime(2024, 1, 1) + timedelta(seconds=second)))
+        session.commit()
+        minutes = rollups.get_history(session, "D", "1m")
+    assert [(r["min_trust"], r["max_trust"], r["trust_score"], r["count"]) for r in minutes] == [
+        (0.5, 0.7, 0.7, 2), (0.6, 0.6, 0.6, 1)
+    ]
+
+def test_inbound_peer_backfill_counts_devices(db):
+    # jumlah baris backfill devices.inbound_peer_count = device yang dihitung ulang, bukan baris inbound_peers
+    with db() as session:
+        for device_id in ("A", "B", "C"):
+            session.add(Device(id=device_id, name=device_id, ownership_type="internal", device_type="RSU"))
+        session.add(Connection(source_device_id="A", target_device_id="B", status=True))
+        session.commit()
+    with engine.begin() as conn:
+        assert migrations.rebuild_inbound_peers(conn) == 3
+    with db() as session:
+        assert session.get(Device, "B").inbound_peer_count == 1
@@ -0,0 +1,47 @@
+# batch /connect/batch harus mencatat trust_history sama seperti /connect satu per satu
+from sqlalchemy import select
+from app import rollups, services
+from app.models import Device, TrustHistory
+
+CONNECTIONS = [
+    {"source_id": "A", "target_id": "B", "status": True},
+    {"source_id": "A", "target_id": "C", "status": True},
+    {"source_id": "B", "target_id": "C", "status": True},
+]
+
+def _record(SessionLocal, record):
+    with SessionLocal() as session:
+        for device_id in "ABC":
+            session.add(Device(id=device_id, name=device_id, ownership_type="external", device_type="Computer", trust_score=0.9))
+        session.commit()
+        record(session)
+
+        rows = session.execute(
+            select(TrustHistory).where(TrustHistory.event_type == "trust_updated")
+            .order_by(TrustHistory.timestamp, TrustHistory.id)
+        ).scalars().all()
+        history = {}
+        for row in rows:
+            history.setdefault(row.device_id, []).append(
+                (row.trust_score, row.connection_count, row.last_connected_device_id, row.notes)
+            )
+        # ringkasan rollup 1m tanpa batas bucket (run satu per satu bisa melewati pergantian menit)
+        totals = {}
+        for device_id in "ABC":
+            buckets = rollups.get_history(session, device_id, "1m")
+            if not buckets:
+                continue
+            totals[device_id] = (
+                sum(b["count"] for b in buckets),
+                min(b["min_trust"] for b in buckets),
+                max(b["max_trust"] for b in buckets),
+                buckets[-1]["trust_score"],
+            )
+        return history, totals
+
+def test_batch_writes_one_history_row_per_interaction(db, reset_db):
+    batch = _record(db, lambda session: services.record_connection(session, CONNECTIONS))
+    reset_db()
+    single = _record(db, lambda session: [services.record_connection(session, dict(c)) for c in CONNECTIONS])
+    assert {device_id: len(rows) for device_id, rows in batch[0].items()} == {"A": 2, "B": 2, "C": 2}
+    assert batch == single
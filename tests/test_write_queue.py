@@ -0,0 +1,104 @@
+# hook session (cache, slot koordinator, ranking, event) di dalam group commit write queue:
+# savepoint per job tidak boleh dianggap sebagai commit/rollback transaksi
+from concurrent.futures import Future
+import pytest
+from sqlalchemy import event
+from app import services
+from app.cache import coordinator_slot, device_cache
+from app.database import ReadSessionLocal, engine
+from app.events import event_bus
+from app.models import Device
+from app.write_queue import SingleWriter
+
+def _run_batch(jobs) -> list:
+    # satu batch dijalankan langsung di thread test, tanpa thread penulis
+    futures = [Future() for _ in jobs]
+    SingleWriter(bind=engine)._commit_batch([(job, (), {}, future) for job, future in zip(jobs, futures)])
+    return futures
+
+def _add_device(SessionLocal, device_id: str, **values):
+    with SessionLocal() as session:
+        session.add(Device(id=device_id, name=device_id, ownership_type="internal", device_type="RSU", **values))
+        session.commit()
+
+def _fail_group_commit(session):
+    # commit transaksi luar (setelah semua job) gagal
+    def fail(session):
+        if not session.in_nested_transaction():
+            raise RuntimeError("group commit failed")
+    event.listen(session, "before_commit", fail)
+
+def _set_trust(device_id: str, trust_score: float):
+    def job(session):
+        session.get(Device, device_id).trust_score = trust_score
+        session.commit()
+    return job
+
+def test_cache_invalidated_after_group_commit(db):
+    _add_device(db, "D", trust_score=0.5)
+
+    def concurrent_read(session):
+        # request lain membaca nilai yang sudah di-commit selagi batch belum selesai
+        with ReadSessionLocal() as other:
+            assert device_cache.get(other, "D").trust_score == 0.5
+
+    _run_batch([_set_trust("D", 0.9), concurrent_read])
+    with db() as session:
+        assert device_cache.get(session, "D").trust_score == 0.9
+
+def test_coordinator_slot_not_published_when_group_commit_fails(db):
+    _add_device(db, "RSU-0", trust_score=0.9)
+    futures = _run_batch([services.select_coordinator, _fail_group_commit])
+    assert all(future.exception() is not None for future in futures)
+    assert coordinator_slot.epoch is None
+    with db() as session:
+        assert services.get_coordinator_id(session) is None
+
+def test_ranking_invalidated_when_group_commit_fails(db):
+    _add_device(db, "RSU-0", trust_score=0.9)
+    _add_device(db, "RSU-1", trust_score=0.5)
+    with db() as session:
+        services.select_coordinator(session)
+        session.commit()
+    assert services.coordinator_ranking.stats()["loaded"]
+
+    # kenaikan trust RSU-1 masuk ranking saat flush, lalu dibatalkan bersama batch
+    _run_batch([_set_trust("RSU-1", 0.95), _fail_group_commit])
+    assert not services.coordinator_ranking.stats()["loaded"]
+
+@pytest.fixture
+def published(monkeypatch):
+    batches = []
+    monkeypatch.setattr(event_bus, "publish", lambda events: batches.append(list(events or [])))
+    return batches
+
+def _failing_job(session):
+    session.get(Device, "B").trust_score = 0.1
+    session.commit()
+    raise ValueError("job failed")
+
+def _three_jobs(published) -> list:
+    def last_job(session):
+        # belum ada event yang dipublikasikan sebelum group commit
+        assert published == []
+        _set_trust("C", 0.8)(session)
+    return [_set_trust("A", 0.9), _failing_job, last_job]
+
+def test_events_published_once_after_group_commit(db, published):
+    for device_id in "ABC":
+        _add_device(db, device_id, trust_score=0.5)
+    published.clear()
+    futures = _run_batch(_three_jobs(published))
+    assert [future.exception() is None for future in futures] == [True, False, True]
+    assert published == [[
+        ("trust_updated", {"device_id": "A", "trust_score": 0.9}),
+        ("trust_updated", {"device_id": "C", "trust_score": 0.8}),
+    ]]
+
+def test_no_events_when_group_commit_fails(db, published):
+    for device_id in "ABC":
+        _add_device(db, device_id, trust_score=0.5)
+    published.clear()
+    futures = _run_batch(_three_jobs(published) + [_fail_group_commit])
+    assert all(future.exception() is not None for future in futures)
+    assert published == []
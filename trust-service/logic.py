@@ -1,5 +1,16 @@
 from enum import Enum
 import math
+import os
+import numpy as np
+
+# batas koneksi per window flooding untuk tiap peran device
+FLOOD_THRESHOLD_DEFAULT = int(os.getenv("FLOOD_THRESHOLD_DEFAULT", "64"))
+FLOOD_THRESHOLD_COORDINATOR = int(os.getenv("FLOOD_THRESHOLD_COORDINATOR", "128"))
+
+# reputasi rater yang rating-nya selalu diabaikan
+INVALID_RATER_REPUTATIONS = ["BLACKLISTED", "VERY_SUSPICIOUS"]
+# reputasi device yang dinilai di mana rating rendah setelah koneksi sukses tetap valid
+LOW_SCORE_ACCEPTED_REPUTATIONS = ["POOR", "SUSPICIOUS", "BLACKLISTED"]
 
 def normalize(value: float, max_value: float = 16.0) -> float:
     return min(value / max_value, 1.0)
@@ -88,7 +99,7 @@ def should_blacklist(trust_score: float, threshold: float = 0.3) -> bool:
     return trust_score < threshold
 
 def get_flooding_threshold(is_coordinator: bool, device_count: int = 0) -> int:
-    return 128 if is_coordinator else 64
+    return FLOOD_THRESHOLD_COORDINATOR if is_coordinator else FLOOD_THRESHOLD_DEFAULT
 
 def evaluate_flooding_risk(recent_connections: int, is_coordinator: bool, device_count: int = 0) -> dict:
     threshold = get_flooding_threshold(is_coordinator, device_count)
@@ -105,4 +116,321 @@ def evaluate_flooding_risk(recent_connections: int, is_coordinator: bool, device
         return {
             "penalty": 0.0,
             "threshold": threshold
-        }
\ No newline at end of file
+        }
+
+def calculate_validated_indirect_trust(peer_evaluations: list, rated_reputation: str) -> tuple:
+    # peer_evaluations: list dict {rating_score, interaction_was_successful, rater_reputation}
+    if not peer_evaluations:
+        return None, "cool_start"
+
+    valid_ratings = []
+    invalid_count = 0
+
+    for evaluation in peer_evaluations:
+        score = evaluation["rating_score"]
+        success = evaluation["interaction_was_successful"]
+        rater_rep = evaluation.get("rater_reputation", "AVERAGE")
+
+        if rater_rep in INVALID_RATER_REPUTATIONS:
+            invalid_count += 1
+            continue
+        if score >= 0.5 and success:
+            valid_ratings.append(score)
+        elif score < 0.5:
+            if not success:
+                valid_ratings.append(score)
+            elif rated_reputation in LOW_SCORE_ACCEPTED_REPUTATIONS:
+                valid_ratings.append(score)
+            else:
+                invalid_count += 1
+        else: 
+            invalid_count +=1
+
+    if not valid_ratings:
+        return 0.0, "ignored"
+
+    return round(sum(valid_ratings) / len(valid_ratings), 3), "validated"
+
+# --- evaluasi lengkap dengan format request/response trust service ---
+# dipakai oleh route di trust_main.py dan oleh backend pada mode TRUST_ENGINE=inprocess
+
+def evaluate_initial_trust(ownership_type: str, memory_gb: float, device_type: str, **_) -> dict:
+    return {
+        "trust_score": calculate_initial_trust(ownership_type, memory_gb, device_type),
+        "computing_power": get_computing_weight(device_type)
+    }
+
+def evaluate_trust_update(
+    last_trust: float,
+    success: bool,
+    peer_evaluations: list = None,
+    centrality_raw: int = 0,
+    rated_reputation: str = "AVERAGE",
+    interaction_count: int = 1,
+    **_
+) -> dict:
+    # 1. Direct Observation
+    direct_trust = get_direct_trust_score(success)
+
+    # 2. Indirect Observation
+    indirect_trust_val, indirect_status = calculate_validated_indirect_trust(peer_evaluations, rated_reputation)
+
+    indirect_trust = None
+    if interaction_count <= 1:
+        # interaksi pertama, indirect none untuk mengurangi cold start
+        indirect_trust = None
+    elif indirect_status in ["ignored", "cool_start"]:
+        #interaksi selanjutnya tanpa rating valid
+        indirect_trust = 0.0
+    else:
+        #rating valid
+        indirect_trust = indirect_trust_val
+
+    # 3. Centrality score dari jumlah koneksi unik
+    centrality = calculate_log_centrality(centrality_raw)
+
+    # 4. Hitung trust baru
+    updated = calculate_updated_trust(
+        last_trust=last_trust,
+        direct_trust=direct_trust,
+        indirect_trust=indirect_trust,
+        centrality_score=centrality
+    )
+
+    return {
+        "updated_trust": updated,
+        "direct_trust": direct_trust,
+        "indirect_trust": round(indirect_trust, 3) if indirect_trust is not None else None,
+        "indirect_status": indirect_status,
+        "centrality_score": round(centrality, 3),
+        "blacklisted": should_blacklist(updated)
+    }
+
+def evaluate_trust_updates(payloads: list) -> list:
+    # sama dengan evaluate_trust_update untuk setiap payload, dihitung dengan versi array
+    if not payloads:
+        return []
+
+    scores, successes, mask, rater_reputations = pack_peer_evaluations([
+        [
+            (e["rating_score"], e["interaction_was_successful"], e.get("rater_reputation", "AVERAGE"))
+            for e in (p.get("peer_evaluations") or [])
+        ]
+        for p in payloads
+    ])
+    result = calculate_trust_batch(
+        last_trust=np.array([p["last_trust"] for p in payloads], dtype=float),
+        success=np.array([p["success"] for p in payloads], dtype=bool),
+        centrality_raw=np.array([p.get("centrality_raw", 0) for p in payloads]),
+        interaction_count=np.array([p.get("interaction_count", 1) for p in payloads]),
+        scores=scores,
+        successes=successes,
+        mask=mask,
+        rater_reputations=rater_reputations,
+        rated_reputation=np.array([p.get("rated_reputation", "AVERAGE") for p in payloads], dtype=object)
+    )
+
+    return [
+        {
+            "updated_trust": updated,
+            "direct_trust": direct,
+            "indirect_trust": None if math.isnan(indirect) else indirect,
+            "indirect_status": status,
+            "centrality_score": centrality,
+            "blacklisted": blacklisted
+        }
+        for updated, direct, indirect, status, centrality, blacklisted in zip(
+            result["updated_trust"].tolist(),
+            result["direct_trust"].tolist(),
+            result["indirect_trust"].tolist(),
+            result["indirect_status"].tolist(),
+            result["centrality_score"].tolist(),
+            result["blacklisted"].tolist()
+        )
+    ]
+
+def get_reputation_level(trust_score: float, is_blacklisted: bool = False, is_flagged: bool = False, suspicious_count: int = 0) -> str:
+    # juga dipakai backend (app/services.py) lewat load_trust_logic
+    if is_blacklisted:
+        return "BLACKLISTED"
+    elif is_flagged:
+        if suspicious_count >= 5:
+            return "VERY_SUSPICIOUS"
+        else:
+            return "SUSPICIOUS"
+    elif trust_score >= 0.8:
+        return "EXCELLENT"
+    elif trust_score >= 0.6:
+        return "GOOD"
+    elif trust_score >= 0.4:
+        return "AVERAGE"
+    else:
+        return "POOR"
+
+def evaluate_trust_sequences(payloads: list) -> list:
+    """
+    Beberapa interaksi satu device dalam satu batch, dievaluasi berurutan seperti
+    memanggil evaluate_trust_update sekali per interaksi: last_trust dan reputasi
+    device pada step berikutnya diambil dari hasil step sebelumnya. Evaluasi
+    berhenti setelah device ter-blacklist. Step ke-k dari semua device dihitung
+    sekaligus dengan versi array.
+
+    peer_evaluations setiap step adalah input yang diambil backend sekali per batch,
+    jadi rating yang ditulis oleh interaksi sebelumnya di batch yang sama tidak ikut
+    terlihat (berbeda dengan memanggil /connect satu per satu).
+    """
+    results = [[] for _ in payloads]
+    last_trust = [p["last_trust"] for p in payloads]
+    reputation = [p.get("rated_reputation", "AVERAGE") for p in payloads]
+    active = [i for i, p in enumerate(payloads) if p.get("steps")]
+
+    k = 0
+    while active:
+        step_results = evaluate_trust_updates([
+            {**payloads[i]["steps"][k], "last_trust": last_trust[i], "rated_reputation": reputation[i]}
+            for i in active
+        ])
+
+        next_active = []
+        for i, result in zip(active, step_results):
+            results[i].append(result)
+            last_trust[i] = result["updated_trust"]
+            reputation[i] = get_reputation_level(
+                result["updated_trust"],
+                is_blacklisted=result["blacklisted"],
+                is_flagged=payloads[i].get("is_flagged", False),
+                suspicious_count=payloads[i].get("suspicious_count", 0)
+            )
+            if not result["blacklisted"] and k + 1 < len(payloads[i]["steps"]):
+                next_active.append(i)
+        active = next_active
+        k += 1
+
+    return [{"steps": steps} for steps in results]
+
+def evaluate_security(conn_count_last_period: int, is_coordinator: bool = False, **_) -> dict:
+    flood_result = evaluate_flooding_risk(
+        recent_connections=conn_count_last_period,
+        is_coordinator=is_coordinator,
+    )
+    
+    return {
+        "penalty": flood_result["penalty"],
+        "threshold_used": flood_result["threshold"]
+    }
+
+# --- versi array (NumPy) untuk evaluasi banyak device sekaligus ---
+# hasilnya harus identik dengan versi skalar di atas setelah pembulatan
+
+def round_array(values, ndigits: int = 3) -> np.ndarray:
+    values = np.asarray(values, dtype=float)
+    rounded = np.round(values, ndigits)
+    # np.round bisa berbeda dengan round() Python pada nilai yang tepat di tengah,
+    # nilai seperti itu dibulatkan ulang satu per satu
+    scaled = values * 10 ** ndigits
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_tie):
+        rounded.flat[i] = round(float(values.flat[i]), ndigits)
+    return rounded
+
+_CENTRALITY_TABLE = np.array([calculate_log_centrality(n) for n in range(101)])
+
+def calculate_log_centrality_array(unique_connections) -> np.ndarray:
+    # input berupa bilangan bulat 0..100 (di atasnya sama dengan 100), jadi cukup lookup tabel
+    counts = np.clip(np.asarray(unique_connections, dtype=np.int64), 0, 100)
+    return _CENTRALITY_TABLE[counts]
+
+def calculate_updated_trust_array(last_trust, direct_trust, indirect_trust, centrality_score) -> np.ndarray:
+    # indirect_trust NaN berarti None pada versi skalar
+    td = np.asarray(last_trust, dtype=float) + np.asarray(direct_trust, dtype=float)
+    indirect = np.asarray(indirect_trust, dtype=float)
+    centrality = np.asarray(centrality_score, dtype=float)
+
+    with_indirect = (0.4 * td) + (0.3 * np.nan_to_num(indirect)) + (0.3 * centrality)
+    without_indirect = (0.7 * td) + (0.3 * centrality)
+    t_updated = np.where(np.isnan(indirect), without_indirect, with_indirect)
+    return np.clip(round_array(t_updated, 3), 0.0, 1.0)
+
+def pack_peer_evaluations(evaluations_per_device):
+    """
+    Mengubah list evaluasi per device [(rating_score, interaction_was_successful,
+    rater_reputation), ...] menjadi matriks (n_device x max_rating) beserta mask.
+    """
+    n = len(evaluations_per_device)
+    k = max((len(e) for e in evaluations_per_device), default=0)
+    scores = np.zeros((n, k), dtype=float)
+    successes = np.zeros((n, k), dtype=bool)
+    mask = np.zeros((n, k), dtype=bool)
+    rater_reputations = np.full((n, k), "AVERAGE", dtype=object)
+
+    for i, evaluations in enumerate(evaluations_per_device):
+        for j, (score, success, rater_rep) in enumerate(evaluations):
+            scores[i, j] = score
+            successes[i, j] = success
+            mask[i, j] = True
+            rater_reputations[i, j] = rater_rep
+    return scores, successes, mask, rater_reputations
+
+def calculate_validated_indirect_trust_array(scores, successes, mask, rater_reputations, rated_reputation):
+    scores = np.asarray(scores, dtype=float)
+    successes = np.asarray(successes, dtype=bool)
+    mask = np.asarray(mask, dtype=bool)
+    n, k = scores.shape
+
+    trusted_rater = mask & ~np.isin(np.asarray(rater_reputations, dtype=object), INVALID_RATER_REPUTATIONS)
+    low_score_accepted = np.isin(np.asarray(rated_reputation, dtype=object), LOW_SCORE_ACCEPTED_REPUTATIONS)[:, None]
+    valid = trusted_rater & (
+        ((scores >= 0.5) & successes) |
+        ((scores < 0.5) & (~successes | low_score_accepted))
+    )
+
+    # dijumlahkan per kolom agar urutan penjumlahan sama dengan sum() skalar
+    total = np.zeros(n, dtype=float)
+    for j in range(k):
+        total += np.where(valid[:, j], scores[:, j], 0.0)
+    valid_count = valid.sum(axis=1)
+
+    has_ratings = mask.any(axis=1)
+    status = np.where(~has_ratings, "cool_start", np.where(valid_count == 0, "ignored", "validated"))
+
+    mean = round_array(total / np.maximum(valid_count, 1), 3)
+    indirect = np.where(status == "validated", mean, np.where(status == "ignored", 0.0, np.nan))
+    return indirect, status
+
+def calculate_trust_batch(
+    last_trust,
+    success,
+    centrality_raw,
+    interaction_count,
+    scores,
+    successes,
+    mask,
+    rater_reputations,
+    rated_reputation
+) -> dict:
+    # padanan vektor dari /trust/calculate untuk seluruh kolom input
+    success = np.asarray(success, dtype=bool)
+    interaction_count = np.asarray(interaction_count)
+
+    direct_trust = np.where(success, get_direct_trust_score(True), get_direct_trust_score(False))
+
+    indirect_val, indirect_status = calculate_validated_indirect_trust_array(
+        scores, successes, mask, rater_reputations, rated_reputation
+    )
+    indirect_trust = np.where(
+        interaction_count <= 1,
+        np.nan,
+        np.where(indirect_status == "validated", indirect_val, 0.0)
+    )
+
+    centrality = calculate_log_centrality_array(centrality_raw)
+    updated = calculate_updated_trust_array(last_trust, direct_trust, indirect_trust, centrality)
+
+    return {
+        "updated_trust": updated,
+        "direct_trust": direct_trust,
+        "indirect_trust": round_array(indirect_trust, 3),
+        "indirect_status": indirect_status,
+        "centrality_score": round_array(centrality, 3),
+        "blacklisted": should_blacklist(updated)
+    }
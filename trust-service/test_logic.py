@@ -0,0 +1,113 @@
+# pytest trust-service/test_logic.py
+# versi array (NumPy) di logic.py harus identik dengan versi skalar setelah pembulatan
+
+import math
+import random
+import numpy as np
+import pytest
+import logic
+
+def _same(a, b) -> bool:
+    if a is None or b is None:
+        return a is None and b is None
+    if isinstance(a, float) and math.isnan(a):
+        return isinstance(b, float) and math.isnan(b)
+    return a == b
+
+def test_round_array_matches_round_on_near_ties():
+    # nilai x.xxx5 yang tidak tepat terwakili di float: np.round dan round() bisa berbeda
+    values = [i / 1000 + 0.0005 for i in range(-2000, 2000)] + [0.1235, 0.2345, 0.0005, 1.0005]
+    rounded = logic.round_array(values, 3)
+    assert [round(v, 3) for v in values] == rounded.tolist()
+
+def test_calculate_updated_trust_array_matches_scalar():
+    rng = np.random.default_rng(2)
+    n = 200_000
+    last_trust = rng.uniform(0.0, 1.0, n)
+    direct = np.where(rng.random(n) < 0.5, 0.01, -0.01)
+    indirect = rng.uniform(0.0, 1.0, n)
+    indirect[rng.random(n) < 0.3] = np.nan
+    centrality = rng.uniform(0.0, 1.0, n)
+    # sebagian input dibulatkan ke 3 desimal agar banyak hasil jatuh tepat di tengah
+    coarse = rng.random(n) < 0.5
+    last_trust[coarse] = np.round(last_trust[coarse], 3)
+    centrality[coarse] = np.round(centrality[coarse], 3)
+    indirect[coarse] = np.round(indirect[coarse], 1)
+
+    array_result = logic.calculate_updated_trust_array(last_trust, direct, indirect, centrality).tolist()
+    mismatches = [
+        i for i in range(n)
+        if array_result[i] != logic.calculate_updated_trust(
+            float(last_trust[i]), float(direct[i]),
+            None if math.isnan(indirect[i]) else float(indirect[i]),
+            float(centrality[i])
+        )
+    ]
+    assert mismatches == []
+
+def test_calculate_log_centrality_array_matches_scalar():
+    counts = list(range(0, 150))
+    assert logic.calculate_log_centrality_array(counts).tolist() == [logic.calculate_log_centrality(n) for n in counts]
+
+def _random_payload(rng: random.Random) -> dict:
+    reputations = ["EXCELLENT", "GOOD", "AVERAGE", "POOR", "SUSPICIOUS", "VERY_SUSPICIOUS", "BLACKLISTED"]
+    return {
+        "last_trust": round(rng.uniform(0.2, 1.0), 3),
+        "success": rng.random() < 0.8,
+        "centrality_raw": rng.randint(0, 120),
+        "interaction_count": rng.randint(1, 10),
+        "rated_reputation": rng.choice(reputations),
+        "peer_evaluations": [
+            {
+                "rating_score": round(rng.uniform(0.0, 1.0), 2),
+                "interaction_was_successful": rng.random() < 0.7,
+                "rater_reputation": rng.choice(reputations),
+            }
+            for _ in range(rng.randint(0, 5))
+        ],
+    }
+
+def test_evaluate_trust_updates_matches_evaluate_trust_update():
+    rng = random.Random(5)
+    payloads = [_random_payload(rng) for _ in range(5000)]
+    batch = logic.evaluate_trust_updates(payloads)
+    for payload, result in zip(payloads, batch):
+        expected = logic.evaluate_trust_update(**payload)
+        assert set(result) == set(expected)
+        for key in expected:
+            assert _same(result[key], expected[key]), (key, payload, result, expected)
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_evaluate_trust_sequences_matches_sequential_updates(seed):
+    # setiap step sama dengan evaluate_trust_update dengan last_trust dan reputasi dari step
+    # sebelumnya; peer_evaluations setiap step adalah input (lihat docstring
+    # evaluate_trust_sequences), bukan rating yang ditulis oleh step sebelumnya di batch
+    rng = random.Random(seed)
+    payloads = []
+    for _ in range(300):
+        steps = [_random_payload(rng) for _ in range(rng.randint(0, 6))]
+        for step in steps:
+            del step["last_trust"], step["rated_reputation"]
+        payloads.append({
+            "last_trust": round(rng.uniform(0.25, 1.0), 3),
+            "rated_reputation": "AVERAGE",
+            "is_flagged": rng.random() < 0.2,
+            "suspicious_count": rng.randint(0, 6),
+            "steps": steps,
+        })
+
+    for payload, result in zip(payloads, logic.evaluate_trust_sequences(payloads)):
+        last_trust, reputation, expected = payload["last_trust"], payload["rated_reputation"], []
+        for step in payload["steps"]:
+            step_result = logic.evaluate_trust_update(**step, last_trust=last_trust, rated_reputation=reputation)
+            expected.append(step_result)
+            last_trust = step_result["updated_trust"]
+            reputation = logic.get_reputation_level(
+                last_trust, step_result["blacklisted"], payload["is_flagged"], payload["suspicious_count"]
+            )
+            if step_result["blacklisted"]:
+                break
+        assert len(result["steps"]) == len(expected)
+        for got, want in zip(result["steps"], expected):
+            for key in want:
+                assert _same(got[key], want[key]), (key, got, want)